@@ -0,0 +1,68 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+from .reference_cache import LocalCache
+
+CACHE_KEY = 'auth_token:{}'
+# Счётчики меняются без сохранения пользователя и в кеше бы устаревали,
+# хеш пароля незачем копировать в общий кеш: у пользователя из кеша эти
+# поля отложены и читаются из БД при обращении
+UNCACHED_FIELDS = {'recipes_count', 'subscribers_count', 'password'}
+CACHED_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname not in UNCACHED_FIELDS
+)
+
+tokens = LocalCache(
+    size=settings.TOKEN_CACHE_SIZE,
+    timeout=settings.TOKEN_CACHE_LOCAL_TIMEOUT
+)
+
+
+def get_cache_key(key):
+    """Сам токен в ключ кеша не попадает"""
+    return CACHE_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def invalidate_tokens(keys):
+    """
+    Сбрасывает токены в общем кеше и в памяти текущего воркера; остальные
+    воркеры забудут их через TOKEN_CACHE_LOCAL_TIMEOUT.
+    """
+    keys = list(keys)
+    for key in keys:
+        tokens.delete(key)
+    cache.delete_many([get_cache_key(key) for key in keys])
+
+
+def invalidate_user_tokens(user_id):
+    invalidate_tokens(
+        Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса к authtoken_token и users_user на
+    каждый вызов: поля пользователя без счётчиков и пароля ищутся по
+    токену в LRU воркера, затем в общем кеше и только потом в БД.
+    """
+
+    def authenticate_credentials(self, key):
+        values = tokens.get(key)
+        if values is None:
+            cache_key = get_cache_key(key)
+            values = cache.get(cache_key)
+            if values is None:
+                user, token = super().authenticate_credentials(key)
+                values = tuple(getattr(user, name) for name in CACHED_FIELDS)
+                cache.set(cache_key, values, settings.TOKEN_CACHE_TIMEOUT)
+            tokens.set(key, values)
+        # Вьюхи меняют request.user, поэтому каждый раз новый объект
+        user = User.from_db(DEFAULT_DB_ALIAS, CACHED_FIELDS, values)
+        return user, Token(key=key, user=user)
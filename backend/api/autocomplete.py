@@ -0,0 +1,85 @@
+from bisect import bisect_left
+from functools import lru_cache
+
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower
+
+from recipes.models import Ingredient
+from .reference_cache import get_version
+
+PREFIX_RANK = 0
+CONTAINS_RANK = 1
+MAX_CHAR = chr(0x10FFFF)
+# Подсказок больше этого числа пользователь всё равно не просмотрит, а
+# короткий префикс иначе совпадает с тысячами ингредиентов
+MAX_RESULTS = 100
+
+
+class IngredientPrefixIndex:
+    """
+    Отсортированный список названий ингредиентов в нижнем регистре.
+    Поиск по префиксу — двоичный, по подстроке — перебор. Используется
+    вместо индексов БД, когда это не PostgreSQL (например SQLite, где
+    LOWER() не понимает кириллицу).
+    """
+
+    def __init__(self, ingredients):
+        self.entries = sorted(
+            (name.lower(), pk) for pk, name in ingredients)
+        self.keys = [name for name, _ in self.entries]
+
+    def search(self, value, limit=MAX_RESULTS):
+        """
+        Не больше limit pk: (совпадения по началу, по вхождению). Перебор
+        подстрок останавливается, как только набрано limit.
+        """
+        start = bisect_left(self.keys, value)
+        end = bisect_left(self.keys, value + MAX_CHAR, start)
+        prefix = [pk for _, pk in self.entries[start:min(end, start + limit)]]
+        contains = []
+        if len(prefix) < limit:
+            for position, (name, pk) in enumerate(self.entries):
+                if start <= position < end or value not in name:
+                    continue
+                contains.append(pk)
+                if len(prefix) + len(contains) == limit:
+                    break
+        return prefix, contains
+
+
+@lru_cache(maxsize=1)
+def get_prefix_index(version):
+    """Индекс строится заново, когда меняется версия справочника"""
+    return IngredientPrefixIndex(
+        Ingredient.objects.values_list('pk', 'name').iterator())
+
+
+def search_ingredients(queryset, value):
+    """
+    Ищет ингредиенты без учёта регистра: сначала совпадения по началу
+    названия, затем по вхождению подстроки. Фильтр работает и для
+    retrieve, поэтому срез до MAX_RESULTS делает IngredientViewSet.
+    """
+    value = value.strip().lower()
+    if not value:
+        return queryset
+    if connections[queryset.db].vendor == 'postgresql':
+        # Индексы lower(name) text_pattern_ops и gin_trgm_ops
+        # создаются миграцией core.0001_ingredient_search_indexes.
+        queryset = queryset.annotate(lower_name=Lower('name')).filter(
+            lower_name__contains=value
+        )
+        prefix = Q(lower_name__startswith=value)
+    else:
+        starts, contains = get_prefix_index(
+            get_version(Ingredient)).search(value)
+        queryset = queryset.filter(pk__in=starts + contains)
+        prefix = Q(pk__in=starts)
+    return queryset.annotate(
+        rank=Case(
+            When(prefix, then=Value(PREFIX_RANK)),
+            default=Value(CONTAINS_RANK),
+            output_field=IntegerField()
+        )
+    ).order_by('rank', 'name')
@@ -0,0 +1,78 @@
+import hashlib
+
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags
+
+from recipes.models import Ingredient, Tag
+from users.models import Subscribtions
+from .reference_cache import get_version
+
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+def with_signature_fields(queryset, user, ordering=()):
+    """
+    Лёгкий запрос рецептов только с тем, от чего зависит их выдача:
+    даты, отметки пользователя и данные автора. ordering - поля
+    постраничного вывода по ключу: курсор берёт их из тех же объектов.
+    """
+    if user.is_anonymous:
+        is_subscribed = Value(False, output_field=BooleanField())
+    else:
+        is_subscribed = Exists(Subscribtions.objects.filter(
+            user=user, author=OuterRef('author')))
+    return queryset.prefetch_related(None).select_related('author').only(
+        'created', 'updated_at', 'author',
+        *(field.lstrip('-') for field in ordering),
+        *(f'author__{field}' for field in AUTHOR_FIELDS)
+    ).annotate(author_is_subscribed=is_subscribed)
+
+
+def get_signature(recipe):
+    author = recipe.author
+    return (
+        recipe.pk,
+        recipe.updated_at,
+        recipe.is_favorited,
+        recipe.is_in_shopping_cart,
+        recipe.author_is_subscribed,
+        author and tuple(getattr(author, field) for field in AUTHOR_FIELDS),
+    )
+
+
+def get_validators(recipes, *extra):
+    """ETag и Last-Modified для набора рецептов из with_signature_fields"""
+    digest = hashlib.md5(repr((
+        get_version(Tag), get_version(Ingredient), extra,
+        [get_signature(recipe) for recipe in recipes]
+    )).encode())
+    last_modified = max(
+        (recipe.updated_at for recipe in recipes), default=None)
+    return f'"{digest.hexdigest()}"', last_modified
+
+
+def is_not_modified(request, etag):
+    """
+    Только If-None-Match. If-Modified-Since не учитывается: выдача зависит
+    от данных автора и отметок пользователя, у которых нет своей даты
+    изменения, а ETag есть у каждого ответа.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return etag in etags or '*' in etags
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_vary_headers(response, ('Authorization', 'Accept'))
+    return response
+
+
+def not_modified_response(etag, last_modified):
+    return set_validators(HttpResponseNotModified(), etag, last_modified)
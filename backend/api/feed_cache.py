@@ -0,0 +1,84 @@
+import hashlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.http import parse_http_date_safe
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Favourite, Ingredient, Recipe, RecipeTrend, Tag
+from users.models import User
+from .conditional import is_not_modified, not_modified_response, set_validators
+from .reference_cache import fresh_reads, get_versions
+
+CACHE_KEY = 'recipe_feed:{}'
+# Порядок popular зависит от избранного, trending - от рейтинга
+ORDERING_DEPENDENCIES = {'popular': Favourite, 'trending': RecipeTrend}
+
+
+def get_dependencies(request, pk=None):
+    """Версии (модель, pk), от которых зависит ответ"""
+    dependencies = [(Recipe, pk), (Tag, None), (Ingredient, None),
+                    (User, None)]
+    model = ORDERING_DEPENDENCIES.get(request.query_params.get('ordering'))
+    if model is not None:
+        dependencies.append((model, None))
+    return dependencies
+
+
+def get_cache_key(request, pk=None):
+    """
+    Ключ из нормализованной строки запроса и версий данных, от которых
+    зависит ответ. Сигналы увеличивают версии, и старые записи просто
+    перестают читаться, пока не истечёт их срок.
+    """
+    params = sorted(
+        (name, sorted(values))
+        for name, values in request.query_params.lists()
+    )
+    versions = get_versions(*get_dependencies(request, pk))
+    digest = hashlib.md5(repr(
+        (request.get_host(), pk, params, versions)).encode()).hexdigest()
+    return CACHE_KEY.format(digest)
+
+
+class AnonymousResponseCacheMixin:
+    """
+    Кеширует целиком ответы для анонимов: вьюсет оборачивает в
+    cached_response свои list/retrieve. Для авторизованных ответ
+    зависит от пользователя и не кешируется; другие форматы (Browsable
+    API) тоже идут мимо кеша.
+    """
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if (request.user.is_authenticated
+                or not isinstance(request.accepted_renderer, JSONRenderer)):
+            return handler(request, *args, **kwargs)
+        pk = kwargs.get(self.lookup_field)
+        key = get_cache_key(request, pk)
+        entry = cache.get(key)
+        if entry is None:
+            with fresh_reads(*get_dependencies(request, pk)):
+                response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            last_modified = parse_http_date_safe(
+                response.get('Last-Modified'))
+            if last_modified is not None:
+                last_modified = datetime.fromtimestamp(
+                    last_modified, tz=timezone.utc)
+            entry = (
+                JSONRenderer().render(response.data),
+                response.get('ETag'),
+                last_modified
+            )
+            cache.set(key, entry, settings.RECIPE_FEED_CACHE_TIMEOUT)
+        body, etag, last_modified = entry
+        if etag and is_not_modified(request, etag):
+            return not_modified_response(etag, last_modified)
+        response = HttpResponse(body, content_type='application/json')
+        if etag:
+            return set_validators(response, etag, last_modified)
+        return response
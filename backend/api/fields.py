@@ -1,16 +1,117 @@
-import base64
-
-from django.core.files.base import ContentFile
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+
+from recipes.images import ImageError, decode_base64_image
 
 
 class Base64ImageField(serializers.ImageField):
-    """Сериализатор для декодирования картинок"""
+    """
+    Сериализатор для декодирования картинок.
+    Файл получает имя по хешу содержимого, поэтому повторная загрузка
+    той же картинки возвращает путь к уже сохранённому файлу.
+    """
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-
+            try:
+                return decode_base64_image(data)
+            except ImageError as error:
+                raise serializers.ValidationError(str(error))
         return super().to_internal_value(data)
+
+
+class ImageVariantsField(serializers.Field):
+    """Ссылки на уменьшенные копии изображения по размерам и форматам"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        variants = {}
+        for label, formats in value.get('sizes', {}).items():
+            variants[label] = {}
+            for extension, path in formats.items():
+                url = default_storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                variants[label][extension] = url
+        return variants
+
+
+def resolve_pks(queryset, pks):
+    """
+    Загружает объекты по списку pk одним in_bulk и сообщает обо всех
+    отсутствующих pk сразу.
+    """
+    objects = queryset.in_bulk(set(pks))
+    missing = list(dict.fromkeys(pk for pk in pks if pk not in objects))
+    if missing:
+        raise serializers.ValidationError(
+            'Объекты не найдены: ' + ', '.join(map(str, missing)))
+    return objects
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Проверяет только формат pk, без запроса в БД. Объекты подставляет
+    BulkManyRelatedField (для many=True) или BulkRelatedListSerializer
+    (для вложенного сериализатора с many=True) одним запросом на модель.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, ValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    """Список связанных объектов, загруженных одним запросом"""
+
+    def to_internal_value(self, data):
+        pks = super().to_internal_value(data)
+        objects = resolve_pks(self.child_relation.get_queryset(), pks)
+        return [objects[pk] for pk in pks]
+
+
+class BulkRelatedListSerializer(serializers.ListSerializer):
+    """
+    Для вложенных сериализаторов с many=True: собирает pk из всех
+    элементов по каждому BulkPrimaryKeyRelatedField и подставляет
+    объекты одним запросом на поле.
+    """
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        for field in self.child.fields.values():
+            if field.read_only or not isinstance(
+                    field, BulkPrimaryKeyRelatedField):
+                continue
+            *path, name = field.source_attrs
+            containers = []
+            for item in items:
+                for attr in path:
+                    item = item.get(attr, {})
+                if name in item:
+                    containers.append(item)
+            objects = resolve_pks(
+                field.get_queryset(),
+                [container[name] for container in containers]
+            )
+            for container in containers:
+                container[name] = objects[container[name]]
+        return items
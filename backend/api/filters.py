@@ -1,15 +1,25 @@
+from django.db.models import F
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Ingredient, Recipe
+from recipes.search import search_recipes
+from .autocomplete import search_ingredients
+from .reference_cache import get_tag_choices
+
+
+RECIPE_ORDERINGS = {
+    'newest': ('-created', '-id'),
+    'popular': ('-favorites_count', '-id'),
+    'trending': (F('trend__score').desc(nulls_last=True), '-created', '-id'),
+}
 
 
 class RecipeFilter(filters.FilterSet):
     """Фильтр рецептов."""
 
-    tags = filters.ModelMultipleChoiceFilter(
+    tags = filters.MultipleChoiceFilter(
         field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
+        choices=get_tag_choices
     )
     author = filters.NumberFilter(
         field_name='author',
@@ -18,6 +28,11 @@ class RecipeFilter(filters.FilterSet):
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
@@ -26,21 +41,30 @@ class RecipeFilter(filters.FilterSet):
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(shopping__user=user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
 
 class IngredientFilter(filters.FilterSet):
     """Фильтр ингредиентов."""
 
-    name = filters.CharFilter(lookup_expr='startswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name', )
+
+    def filter_name(self, queryset, name, value):
+        return search_ingredients(queryset, value)
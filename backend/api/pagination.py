@@ -1,6 +1,140 @@
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import ValidationError as BadRequest
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+KEYSET_PAGE_SIZE = 20
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Время в курсоре хранится с микросекундами: DjangoJSONEncoder округляет
+    до миллисекунд, и записи из той же миллисекунды выпадали бы из ленты
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
 
 
 class PageLimitPagination(pagination.PageNumberPagination):
-    """Кастомный пагинатор для установки лимита"""
+    """
+    Кастомный пагинатор для установки лимита.
+    С параметром cursor (для первой страницы пустым) переключается на
+    постраничный вывод по ключу: вьюсет задаёт keyset_ordering, а
+    следующая страница выбирается условием WHERE по последней записи,
+    без COUNT(*) и OFFSET.
+    """
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+    unsupported_cursor_message = (
+        'Курсор недоступен для этой сортировки и для поиска')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        if getattr(view, 'keyset_ordering', None) is None:
+            raise BadRequest(
+                {self.cursor_query_param: [self.unsupported_cursor_message]})
+        self.request = request
+        self.ordering = view.keyset_ordering
+        page_size = self.get_page_size(request) or KEYSET_PAGE_SIZE
+        position = self.decode_cursor(request, queryset.model)
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        results = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_position = self.get_position(results[-1])
+        return results
+
+    def paginate_positions(self, request, ordering, model, fetch):
+        """
+        Постраничный вывод по ключу для данных, которые собираются не
+        одним QuerySet: fetch(позиция, количество) отдаёт позиции
+        (значения полей ordering) по порядку.
+        """
+        self.keyset = True
+        self.request = request
+        self.ordering = ordering
+        page_size = self.get_page_size(request) or KEYSET_PAGE_SIZE
+        results = fetch(self.decode_cursor(request, model), page_size + 1)
+        self.next_position = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_position = list(results[-1])
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
+
+    def get_position(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def after(self, position):
+        """Условие «строго после позиции» для составного ключа"""
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(self.ordering[:index], position):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, cls=CursorEncoder)
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(position) != len(self.ordering):
+                raise ValueError
+            return [
+                self.get_field(model, field).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise BadRequest(
+                {self.cursor_query_param: [self.invalid_cursor_message]})
+
+    @staticmethod
+    def get_field(model, field):
+        name = field.lstrip('-')
+        if name == 'pk':
+            return model._meta.pk
+        return model._meta.get_field(name)
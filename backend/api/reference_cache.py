@@ -0,0 +1,178 @@
+import hashlib
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from core.routers import read_database, use_primary
+from recipes.models import Tag
+
+VERSION_KEY = 'reference_data:version:{}'
+CHANGED_KEY = '{}:changed'
+LOCAL_CACHE_SIZE = 512
+
+
+def get_version_key(model, pk=None):
+    key = VERSION_KEY.format(model._meta.label_lower)
+    if pk is None:
+        return key
+    return f'{key}:{pk}'
+
+
+def get_version(model, pk=None):
+    """
+    Текущая версия модели (или одного объекта при заданном pk) из общего
+    кеша. Начальное значение берётся от времени, чтобы после сброса кеша
+    версии не повторялись.
+    """
+    key = get_version_key(model, pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        return cache.get(key)
+    return version
+
+
+def get_versions(*items):
+    """Версии нескольких (модель, pk) одним запросом к кешу"""
+    keys = [get_version_key(model, pk) for model, pk in items]
+    versions = cache.get_many(keys)
+    return tuple(
+        versions[key] if key in versions else get_version(model, pk)
+        for key, (model, pk) in zip(keys, items)
+    )
+
+
+def bump_version(model, pk=None):
+    key = get_version_key(model, pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+    if settings.READ_REPLICAS:
+        cache.set(CHANGED_KEY.format(key), True,
+                  settings.DB_PRIMARY_STICKY_SECONDS)
+
+
+def fresh_reads(*items):
+    """
+    Промах кеша по умолчанию читается с реплики. Если версии (модель, pk)
+    менялись за последние DB_PRIMARY_STICKY_SECONDS, реплика может
+    отставать и под новой версией в кеш попал бы старый ответ: тогда
+    чтения идут в основную базу.
+    """
+    if read_database.get() is None:
+        return nullcontext()
+    changed = cache.get_many([
+        CHANGED_KEY.format(get_version_key(model, pk)) for model, pk in items
+    ])
+    return use_primary() if changed else nullcontext()
+
+
+class LocalCache:
+    """
+    Ограниченный LRU-кеш в памяти процесса; при заданном timeout (секунды)
+    записи устаревают.
+    """
+
+    def __init__(self, size=LOCAL_CACHE_SIZE, timeout=None):
+        self.size = size
+        self.timeout = timeout
+        self.data = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = None
+        if self.timeout is not None:
+            expires = time.monotonic() + self.timeout
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+responses = LocalCache()
+tag_slugs = LocalCache(size=1)
+
+
+def get_tag_choices():
+    """Слаги тегов для фильтра рецептов без запроса к БД на каждый вызов"""
+    version = get_version(Tag)
+    entry = tag_slugs.get(Tag)
+    if entry is None or entry[0] != version:
+        with use_primary():
+            slugs = tuple(Tag.objects.values_list('slug', flat=True))
+        entry = (version, [(slug, slug) for slug in slugs])
+        tag_slugs.set(Tag, entry)
+    return entry[1]
+
+
+class ReferenceDataCacheMixin:
+    """
+    Отдаёт list/retrieve справочника из заранее сериализованного JSON.
+    Записи в памяти воркера сверяются с версией модели в общем кеше,
+    которую сигналы увеличивают при изменении данных. Другие форматы
+    (например, browsable API) отдаются DRF без кеша.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            return handler(request, *args, **kwargs)
+        model = self.get_queryset().model
+        version = get_version(model)
+        key = (model._meta.label_lower, request.get_full_path())
+        entry = responses.get(key)
+        if entry is None or entry[0] != version:
+            with fresh_reads((model, None)):
+                response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            body = JSONRenderer().render(response.data)
+            etag = f'"{version}-{hashlib.md5(body).hexdigest()}"'
+            entry = (version, body, etag)
+            responses.set(key, entry)
+        version, body, etag = entry
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in etags or '*' in etags:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept', ))
+        return response
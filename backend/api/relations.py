@@ -0,0 +1,71 @@
+from rest_framework import serializers
+
+from recipes.models import Favourite, ShoppingList
+from users.models import Subscribtions
+
+# Вид связи: (модель, поле с id объекта)
+RELATIONS = {
+    'favorited': (Favourite, 'recipe_id'),
+    'in_shopping_cart': (ShoppingList, 'recipe_id'),
+    'subscribed': (Subscribtions, 'author_id'),
+}
+
+
+class UserRelations:
+    """
+    Связи текущего пользователя с объектами ответа: избранное, корзина
+    и подписки. Загружаются один раз на запрос и только для нужных id,
+    после чего проверка стоит O(1).
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.loaded = {kind: set() for kind in RELATIONS}
+        self.related = {kind: set() for kind in RELATIONS}
+
+    def load(self, kind, pks):
+        pks = set(pks) - self.loaded[kind]
+        if not pks:
+            return
+        if self.user.is_authenticated:
+            model, field = RELATIONS[kind]
+            self.related[kind].update(model.objects.filter(
+                user=self.user, **{f'{field}__in': pks}
+            ).values_list(field, flat=True))
+        self.loaded[kind].update(pks)
+
+    def has(self, kind, pk):
+        self.load(kind, [pk])
+        return pk in self.related[kind]
+
+    def remember(self, model, pk, value):
+        """Учитывает связь, созданную или удалённую в этом же запросе"""
+        for kind, (relation_model, _) in RELATIONS.items():
+            if relation_model is model:
+                self.loaded[kind].add(pk)
+                if value:
+                    self.related[kind].add(pk)
+                else:
+                    self.related[kind].discard(pk)
+
+
+def get_relations(request):
+    relations = getattr(request, 'user_relations', None)
+    if relations is None:
+        relations = UserRelations(request.user)
+        request.user_relations = relations
+    return relations
+
+
+class RelationsListSerializer(serializers.ListSerializer):
+    """
+    Перед выводом списка даёт дочернему сериализатору загрузить связи
+    для всех объектов разом (метод preload_relations).
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        if request is not None and items:
+            self.child.preload_relations(get_relations(request), items)
+        return super().to_representation(items)
@@ -1,10 +1,20 @@
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
+from recipes.cookable import sync_recipe
+from recipes.counters import delete_rows
 from recipes.models import (Favourite, Ingredient, IngredientInRecipe, Recipe,
                             ShoppingList, Tag)
+from recipes.search import index_recipe
 from users.models import Subscribtions, User
-from .fields import Base64ImageField
+from .fields import (Base64ImageField, BulkPrimaryKeyRelatedField,
+                     BulkRelatedListSerializer, ImageVariantsField)
+from .relations import RelationsListSerializer, get_relations
+from .shopping_cart import invalidate_recipe_carts
+from .utills import get_recipes_limit
+
+BATCH_MAX_SIZE = 100
 
 
 class UserGetSerializer(UserSerializer):
@@ -22,12 +32,18 @@ class UserGetSerializer(UserSerializer):
             'last_name',
             'is_subscribed',
         )
+        list_serializer_class = RelationsListSerializer
+
+    @staticmethod
+    def preload_relations(relations, users):
+        relations.load('subscribed', [
+            user.pk for user in users if not hasattr(user, 'is_subscribed')])
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return Subscribtions.objects.filter(user=user, author=obj).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return get_relations(self.context['request']).has(
+            'subscribed', obj.pk)
 
 
 class UserPostSerializer(UserCreateSerializer):
@@ -48,7 +64,6 @@ class UserWithRecipesSerializer(UserGetSerializer):
     """Сериализатор для пользователя c рецептами"""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta(UserGetSerializer.Meta):
         model = User
@@ -58,19 +73,19 @@ class UserWithRecipesSerializer(UserGetSerializer):
         )
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            limit = get_recipes_limit(self.context.get('request'))
+            recipes = obj.recipes.order_by('-pk')
+            if limit:
+                recipes = recipes[:limit]
         return RecipeShortSerializer(recipes, many=True, read_only=True).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     '''Сериализатор для отображения краткой информации о рецептах'''
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -78,6 +93,7 @@ class RecipeShortSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
 
@@ -129,7 +145,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для ингредиентов в рецептах"""
 
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(),
         source='ingredient.id'
     )
@@ -145,6 +161,31 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientInRecipe
         fields = ('id', 'name', 'measurement_unit', 'amount',)
+        list_serializer_class = BulkRelatedListSerializer
+
+
+class RecipeCoverageSerializer(RecipeShortSerializer):
+    """Краткий рецепт с долей ингредиентов, которые есть у пользователя"""
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = RecipeShortSerializer.Meta.fields + ('coverage', )
+
+
+class CookableQuerySerializer(serializers.Serializer):
+    """Параметры поиска рецептов по имеющимся ингредиентам"""
+    ingredients = serializers.CharField()
+    full = serializers.BooleanField(default=False)
+
+    def validate_ingredients(self, value):
+        try:
+            ids = {int(pk) for pk in value.split(',') if pk.strip()}
+        except ValueError:
+            raise serializers.ValidationError(
+                'Передайте id ингредиентов через запятую')
+        if not ids:
+            raise serializers.ValidationError('Укажите хотя бы один id')
+        return ids
 
 
 class RecipeGetSerializer(serializers.ModelSerializer):
@@ -158,6 +199,7 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -170,23 +212,33 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time'
         )
+        list_serializer_class = RelationsListSerializer
+
+    @staticmethod
+    def preload_relations(relations, recipes):
+        for kind in ('favorited', 'in_shopping_cart'):
+            relations.load(kind, [
+                recipe.pk for recipe in recipes
+                if not hasattr(recipe, f'is_{kind}')
+            ])
+        UserGetSerializer.preload_relations(
+            relations, [recipe.author for recipe in recipes])
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return ShoppingList.objects.filter(
-            recipe=obj, user=request.user
-        ).exists()
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return get_relations(self.context['request']).has(
+            'in_shopping_cart', obj.pk)
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Favourite.objects.filter(recipe=obj, user=request.user).exists()
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return get_relations(self.context['request']).has(
+            'favorited', obj.pk)
 
 
 class RecipePostSerializer(serializers.ModelSerializer):
@@ -195,7 +247,7 @@ class RecipePostSerializer(serializers.ModelSerializer):
         read_only=True,
         default=serializers.CurrentUserDefault()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -233,14 +285,14 @@ class RecipePostSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         cooking_time = data.get('cooking_time')
-        if cooking_time <= 0:
+        if cooking_time is not None and cooking_time <= 0:
             raise serializers.ValidationError(
                 {
                     'error': 'Время не должно быть менее 1 минуты'
                 }
             )
         ingredients_list = []
-        ingredients_in_recipe = data.get('ingredients_in_recipe')
+        ingredients_in_recipe = data.get('ingredients_in_recipe', [])
         for ingredient in ingredients_in_recipe:
             if ingredient.get('amount') <= 0:
                 raise serializers.ValidationError(
@@ -261,25 +313,69 @@ class RecipePostSerializer(serializers.ModelSerializer):
         author = self.context.get('request').user
         ingredients = validated_data.pop('ingredients_in_recipe')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data, author=author)
-        recipe.tags.add(*tags)
-        self.save_ingredients(recipe, ingredients)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data, author=author)
+            recipe.tags.add(*tags)
+            self.save_ingredients(recipe, ingredients)
+            sync_recipe(recipe)
+            index_recipe(recipe)
         return recipe
 
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """
+        Приводит состав рецепта к ingredients, меняя только то, что
+        отличается: удаляет лишние строки, добавляет новые и правит
+        количество у оставшихся.
+        """
+        amounts = {
+            ingredient['ingredient']['id'].pk: ingredient.get('amount')
+            for ingredient in ingredients
+        }
+        current = {
+            item.ingredient_id: item for item in
+            IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        removed = current.keys() - amounts.keys()
+        # Без сигналов на каждую строку: корзины сбрасываются ниже одним
+        # вызовом, выдачу сбрасывает сохранение рецепта
+        delete_rows(IngredientInRecipe, 'recipe', recipe.pk,
+                    'ingredient', removed)
+        added = [
+            IngredientInRecipe(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in amounts.items() if pk not in current
+        ]
+        IngredientInRecipe.objects.bulk_create(added)
+        changed = []
+        for pk, item in current.items():
+            if pk in amounts and item.amount != amounts[pk]:
+                item.amount = amounts[pk]
+                changed.append(item)
+        IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        if added or removed or changed:
+            transaction.on_commit(lambda: invalidate_recipe_carts(recipe.pk))
+        if added or removed:
+            sync_recipe(recipe)
+
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients_in_recipe')
-        tags = validated_data.pop('tags')
-        instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        instance.tags.add(*tags)
-        instance.ingredients.clear()
-        self.save_ingredients(recipe=instance, ingredients=ingredients)
+        ingredients = validated_data.pop('ingredients_in_recipe', None)
+        tags = validated_data.pop('tags', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if tags is not None:
+                instance.tags.set(tags)
+            if ingredients is not None:
+                self.update_ingredients(instance, ingredients)
+            index_recipe(instance)
         return instance
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.with_related(request.user).with_user_flags(
+            request.user).get(pk=instance.pk)
         serializer = RecipeGetSerializer(
             instance,
-            context={'request': self.context.get('request')}
+            context={'request': request}
         )
         return serializer.data
 
@@ -309,6 +405,18 @@ class FavoriteSerializer(serializers.ModelSerializer):
             user=self.context.get('request').user, **validated_data)
 
 
+class RecipeBatchSerializer(serializers.Serializer):
+    """Пачка id рецептов для массового добавления или удаления"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_MAX_SIZE
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
 class ShoppingCartSerializer(serializers.ModelSerializer):
     """Сериализатор для списка покупок"""
     user = serializers.PrimaryKeyRelatedField(
@@ -0,0 +1,139 @@
+import csv
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F, Sum
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import IngredientInRecipe, ShoppingList
+from .reference_cache import bump_version, get_version
+
+CACHE_KEY = 'shopping_cart:{}:{}'
+CHUNK_SIZE = 500
+TITLE = 'Список покупок:'
+PDF_FONT = 'ShoppingCart'
+
+
+def get_cache_key(user_id, version):
+    return CACHE_KEY.format(user_id, version)
+
+
+def invalidate_shopping_cart(user_ids):
+    """
+    Сбрасывает закешированные списки покупок пользователей: версия
+    корзины увеличивается, и выгрузка, начатая до сброса, запишет
+    старые строки под прежней версией, которую уже никто не читает.
+    """
+    for user_id in user_ids:
+        bump_version(ShoppingList, user_id)
+
+
+def invalidate_recipe_carts(recipe_id):
+    """Сбрасывает списки покупок всех, у кого рецепт лежит в корзине"""
+    invalidate_shopping_cart(
+        ShoppingList.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user_id', flat=True)
+    )
+
+
+def get_ingredients_queryset(user):
+    return IngredientInRecipe.objects.filter(
+        recipe__shopping__user=user
+    ).values_list(
+        F('ingredient__name'), F('ingredient__measurement_unit')
+    ).annotate(
+        number=Sum('amount')
+    ).order_by('ingredient__name')
+
+
+def get_ingredients(user):
+    """
+    Отдаёт строки (название, единица, количество) списка покупок.
+    Берёт их из кеша, а при промахе читает БД курсором на сервере
+    и кладёт результат в кеш после полного прохода.
+    """
+    key = get_cache_key(user.id, get_version(ShoppingList, user.id))
+    rows = cache.get(key)
+    if rows is not None:
+        yield from rows
+        return
+    rows = []
+    ingredients = get_ingredients_queryset(user).iterator(
+        chunk_size=CHUNK_SIZE)
+    for row in ingredients:
+        rows.append(row)
+        yield row
+    cache.set(key, rows, settings.SHOPPING_CART_CACHE_TIMEOUT)
+
+
+class Echo:
+    """Псевдо-файл для csv.writer, который сразу возвращает строку"""
+
+    def write(self, value):
+        return value
+
+
+def render_txt(rows):
+    yield f'{TITLE}\n\n'
+    for name, measurement_unit, number in rows:
+        yield f'{name} - {number} {measurement_unit}\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for name, measurement_unit, number in rows:
+        yield writer.writerow((name, measurement_unit, number))
+
+
+def get_pdf_font():
+    """
+    Шрифт с кириллицей. Встроенные шрифты PDF кириллицу не рисуют,
+    поэтому без файла шрифта выгрузка в pdf падает, а не отдаёт пустые
+    строки.
+    """
+    if PDF_FONT in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT
+    if not os.path.exists(settings.SHOPPING_CART_PDF_FONT):
+        raise ImproperlyConfigured(
+            f'Нет шрифта для pdf: {settings.SHOPPING_CART_PDF_FONT}')
+    pdfmetrics.registerFont(TTFont(PDF_FONT, settings.SHOPPING_CART_PDF_FONT))
+    return PDF_FONT
+
+
+def render_pdf(rows):
+    """Шрифт проверяется до начала потоковой отдачи ответа"""
+    return render_pdf_pages(rows, get_pdf_font())
+
+
+def render_pdf_pages(rows, font):
+    buffer = BytesIO()
+    page = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    y = height - 50
+    page.setFont(font, 16)
+    page.drawString(50, y, TITLE)
+    page.setFont(font, 12)
+    for name, measurement_unit, number in rows:
+        y -= 20
+        if y < 50:
+            page.showPage()
+            page.setFont(font, 12)
+            y = height - 50
+        page.drawString(50, y, f'{name} - {number} {measurement_unit}')
+    page.save()
+    yield buffer.getvalue()
+
+
+FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
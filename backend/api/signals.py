@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.images import variants_ready
+from recipes.models import (Favourite, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingList, Tag)
+from users.models import User
+from .authentication import invalidate_tokens, invalidate_user_tokens
+from .conditional import AUTHOR_FIELDS
+from .reference_cache import bump_version
+from .shopping_cart import invalidate_recipe_carts, invalidate_shopping_cart
+
+
+@receiver((post_save, post_delete), sender=ShoppingList)
+def shopping_list_changed(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: invalidate_shopping_cart([instance.user_id]))
+
+
+@receiver((post_save, post_delete), sender=Favourite)
+def favourite_changed(sender, **kwargs):
+    """Сбрасывает кеш анонимов с сортировкой popular"""
+    transaction.on_commit(lambda: bump_version(Favourite))
+
+
+def bump_recipe(recipe_id):
+    """Сбрасывает кеш выдачи рецептов для анонимов: ленту и сам рецепт"""
+    bump_version(Recipe)
+    bump_version(Recipe, recipe_id)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    """
+    Теги меняются только вместе с сохранением рецепта (API и админка),
+    поэтому m2m_changed для них не слушается: с получателем Django
+    перед вставкой тегов делает лишний SELECT.
+    """
+    transaction.on_commit(lambda: bump_recipe(instance.pk))
+
+
+@receiver(variants_ready, sender=Recipe)
+def recipe_variants_ready(sender, recipe_ids, **kwargs):
+    def invalidate():
+        bump_version(Recipe)
+        for recipe_id in recipe_ids:
+            bump_version(Recipe, recipe_id)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def ingredient_in_recipe_changed(sender, instance, **kwargs):
+    def invalidate():
+        invalidate_recipe_carts(instance.recipe_id)
+        bump_recipe(instance.recipe_id)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_changed(sender, instance, action, reverse, **kwargs):
+    if reverse or not action.startswith('post_'):
+        return
+
+    def invalidate():
+        invalidate_recipe_carts(instance.pk)
+        bump_recipe(instance.pk)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(pre_save, sender=User)
+def author_saving(sender, instance, update_fields=None, **kwargs):
+    """
+    Запоминает, поменялись ли поля автора, которые видны в выдаче
+    рецептов. Регистрация, вход и смена пароля их не трогают.
+    """
+    instance._author_changed = False
+    if instance._state.adding or (
+            update_fields and not set(update_fields) & set(AUTHOR_FIELDS)):
+        return
+    old = User.objects.filter(pk=instance.pk).values(*AUTHOR_FIELDS).first()
+    instance._author_changed = old is not None and any(
+        old[field] != getattr(instance, field) for field in AUTHOR_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, **kwargs):
+    if getattr(instance, '_author_changed', False):
+        transaction.on_commit(lambda: bump_version(User))
+
+
+@receiver(post_delete, sender=User)
+def author_deleted(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(User))
+
+
+@receiver(post_save, sender=User)
+def user_credentials_changed(sender, instance, update_fields=None, **kwargs):
+    """
+    Смена пароля, деактивация и любые правки профиля сбрасывают
+    пользователя из кеша токенов; вход меняет только last_login.
+    """
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    transaction.on_commit(lambda: invalidate_user_tokens(instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Выход (djoser удаляет токен) и удаление пользователя"""
+    transaction.on_commit(lambda: invalidate_tokens([instance.key]))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def reference_data_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(sender))
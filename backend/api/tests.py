@@ -0,0 +1,808 @@
+import base64
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Favourite, FeedEntry, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingList, Tag)
+from users.models import Subscribtions, User
+from recipes.cookable import sync_recipe
+from recipes.feed import read_feed, trim_feeds
+from recipes.images import decode_base64_image
+from recipes.search import index_recipe, search_recipes
+from recipes.trending import compute_scores, rebuild_trending
+from .authentication import (CACHED_FIELDS, CachedTokenAuthentication,
+                             get_cache_key)
+from .autocomplete import IngredientPrefixIndex
+from .reference_cache import get_version
+from .relations import UserRelations
+from .shopping_cart import get_ingredients, invalidate_shopping_cart
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@test.ru', password='x',
+            first_name='Читатель', last_name='Тестов')
+        authors = [
+            User.objects.create_user(
+                username=f'author{number}', email=f'author{number}@test.ru',
+                password='x', first_name='Автор', last_name=str(number))
+            for number in range(3)
+        ]
+        Subscribtions.objects.create(user=cls.user, author=authors[0])
+        tags = [
+            Tag.objects.create(
+                name=f'тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}')
+            for number in range(2)
+        ]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(5)
+        )
+        ingredients = list(Ingredient.objects.all())
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=authors[number % 3], name=f'рецепт {number}',
+                text='текст', image='recipes/temp.png', cooking_time=5)
+            recipe.tags.set(tags)
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=10)
+                for ingredient in ingredients[:3]
+            )
+
+    def count_queries(self, client, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(f'/api/recipes/?limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), limit)
+        return len(context)
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        counts = {limit: self.count_queries(client, limit)
+                  for limit in (1, 6, 12)}
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_anonymous(self):
+        counts = {limit: self.count_queries(APIClient(), limit)
+                  for limit in (1, 6, 12)}
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+
+class SubscriptionsQueriesTest(TestCase):
+    """Число запросов подписок не зависит от числа авторов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}', email=f'author{number}@test.ru',
+                password='x')
+            for number in range(5)
+        ]
+        for author in cls.authors:
+            for number in range(3):
+                Recipe.objects.create(
+                    author=author, name=f'рецепт {number}', text='текст',
+                    image='recipes/temp.png', cooking_time=5)
+        cls.readers = {}
+        for count in (1, 5):
+            reader = User.objects.create_user(
+                username=f'reader{count}', email=f'reader{count}@test.ru',
+                password='x')
+            Subscribtions.objects.bulk_create(
+                Subscribtions(user=reader, author=author)
+                for author in cls.authors[:count])
+            cls.readers[count] = reader
+
+    def count_queries(self, count):
+        client = APIClient()
+        client.force_authenticate(self.readers[count])
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(
+                '/api/users/subscriptions/?limit=10&recipes_limit=2')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), count)
+        for author in results:
+            self.assertEqual(len(author['recipes']), 2)
+            self.assertEqual(author['recipes_count'], 3)
+            self.assertTrue(author['is_subscribed'])
+        return len(context)
+
+    def test_queries(self):
+        self.assertEqual(self.count_queries(1), self.count_queries(5))
+
+
+class RecipeCreateQueriesTest(TestCase):
+    """Теги и ингредиенты нового рецепта читаются пачкой"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x')
+        cls.tags = [
+            Tag.objects.create(
+                name=f'тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}')
+            for number in range(3)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(30)
+        )
+        cls.ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, client, tags, ingredients):
+        data = {
+            'name': 'рецепт', 'text': 'текст', 'cooking_time': 5,
+            'tags': [tag.pk for tag in self.tags[:tags]],
+            'ingredients': [
+                {'id': pk, 'amount': 10}
+                for pk in self.ingredients[:ingredients]
+            ],
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(response.json()['ingredients']), ingredients)
+        self.assertEqual(len(response.json()['tags']), tags)
+        return len(context)
+
+    def test_queries(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.count_queries(client, 1, 1)
+        self.assertEqual(self.count_queries(client, 1, 1),
+                         self.count_queries(client, 3, 30))
+
+
+class UserRelationsTest(TestCase):
+    """Связи текущего пользователя загружаются одним запросом на вид"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@test.ru', password='x')
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}', email=f'author{number}@test.ru',
+                password='x')
+            for number in range(8)
+        ]
+        Subscribtions.objects.bulk_create(
+            Subscribtions(user=cls.reader, author=author)
+            for author in cls.authors[::2])
+
+    def count_queries(self, client, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(f'/api/users/?limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        subscribed = {
+            user['id']: user['is_subscribed']
+            for user in response.json()['results']
+        }
+        self.assertEqual(len(subscribed), limit)
+        for author in self.authors:
+            if author.pk in subscribed:
+                self.assertEqual(subscribed[author.pk],
+                                 author in self.authors[::2])
+        return len(context)
+
+    def test_list_queries(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        self.assertEqual(self.count_queries(client, 2),
+                         self.count_queries(client, 9))
+
+    def test_loaded_once(self):
+        relations = UserRelations(self.reader)
+        pks = [author.pk for author in self.authors]
+        with self.assertNumQueries(1):
+            relations.load('subscribed', pks)
+            relations.load('subscribed', pks[:3])
+            self.assertTrue(relations.has('subscribed', pks[0]))
+            self.assertFalse(relations.has('subscribed', pks[1]))
+        relations.remember(Subscribtions, pks[1], True)
+        with self.assertNumQueries(0):
+            self.assertTrue(relations.has('subscribed', pks[1]))
+
+
+class ShoppingCartCacheTest(TestCase):
+    """Выгрузка, начатая до сброса кеша, не возвращает старые строки"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@test.ru', password='x')
+        recipe = Recipe.objects.create(
+            author=cls.user, name='рецепт', text='текст',
+            image='recipes/temp.png', cooking_time=5)
+        for number in range(3):
+            IngredientInRecipe.objects.create(
+                recipe=recipe, amount=10,
+                ingredient=Ingredient.objects.create(
+                    name=f'ингредиент {number}', measurement_unit='г'))
+        ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidated_render_is_not_cached(self):
+        rows = get_ingredients(self.user)
+        next(rows)
+        invalidate_shopping_cart([self.user.pk])
+        list(rows)
+        IngredientInRecipe.objects.update(amount=20)
+        amounts = {number for _, _, number in get_ingredients(self.user)}
+        self.assertEqual(amounts, {20})
+
+    def test_rows_are_cached(self):
+        list(get_ingredients(self.user))
+        IngredientInRecipe.objects.update(amount=20)
+        amounts = {number for _, _, number in get_ingredients(self.user)}
+        self.assertEqual(amounts, {10})
+
+
+class IngredientPrefixIndexTest(SimpleTestCase):
+    """Запасной индекс автодополнения отдаёт не больше limit pk"""
+
+    def setUp(self):
+        self.index = IngredientPrefixIndex([
+            (1, 'Сахар'), (2, 'сахарная пудра'), (3, 'Тростниковый сахар'),
+            (4, 'соль'), (5, 'ванильный сахар'),
+        ])
+
+    def test_prefix_before_contains(self):
+        self.assertEqual(self.index.search('сахар'), ([1, 2], [5, 3]))
+
+    def test_limit(self):
+        self.assertEqual(self.index.search('сахар', limit=3), ([1, 2], [5]))
+        self.assertEqual(self.index.search('с', limit=2), ([1, 2], []))
+
+
+class IngredientSearchTest(TestCase):
+    """Фильтр name не ломает retrieve"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sugar = Ingredient.objects.create(
+            name='сахар', measurement_unit='г')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_and_retrieve(self):
+        client = APIClient()
+        response = client.get('/api/ingredients/?name=са')
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['сахар'])
+        response = client.get(f'/api/ingredients/{self.sugar.pk}/?name=са')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'сахар')
+
+
+class ReferenceDataCacheTest(TestCase):
+    """Кеш справочников учитывает формат ответа"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='завтрак', color='#E26C2D', slug='breakfast')
+
+    def test_json_is_cached_and_html_is_negotiated(self):
+        client = APIClient()
+        response = client.get('/api/tags/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()[0]['slug'], 'breakfast')
+        response = client.get('/api/tags/', HTTP_ACCEPT='text/html')
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+        self.assertIn('Accept', client.get('/api/tags/')['Vary'])
+
+
+class ConditionalRecipeTest(TestCase):
+    """Условные запросы рецепта видят изменения автора"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x',
+            first_name='Повар', last_name='Старый')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='рецепт', text='текст',
+            image='recipes/temp.png', cooking_time=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalid_pk(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/recipes/abc/').status_code, 404)
+        client.force_authenticate(self.author)
+        self.assertEqual(client.get('/api/recipes/abc/').status_code, 404)
+
+    def test_if_modified_since_after_author_rename(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        client = APIClient()
+        response = client.get(url)
+        last_modified = response['Last-Modified']
+        self.assertEqual(client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.author.last_name = 'Новый'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save()
+        response = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['author']['last_name'], 'Новый')
+
+
+class KeysetPaginationTest(TestCase):
+    """Курсор работает только с сортировками, которые он описывает"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x')
+        # Все рецепты в одной миллисекунде: курсор не должен их терять
+        created = timezone.now().replace(microsecond=500)
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=author, name=f'суп {number}', text='текст',
+                image='recipes/temp.png', cooking_time=5)
+            Recipe.objects.filter(pk=recipe.pk).update(
+                created=created + timedelta(microseconds=number * 100))
+
+    def test_pages(self):
+        client = APIClient()
+        response = client.get('/api/recipes/?cursor=&limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+        response = client.get(response.json()['next'])
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertIsNone(response.json()['next'])
+
+    def test_ordering_fields_are_loaded(self):
+        client = APIClient()
+        counts = []
+        for ordering in ('newest', 'popular'):
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(
+                    f'/api/recipes/?ordering={ordering}&cursor=&limit=2')
+            self.assertIsNotNone(response.json()['next'])
+            counts.append(len(context))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_cursor_with_search(self):
+        response = APIClient().get('/api/recipes/?cursor=&search=суп')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.json())
+
+    def test_invalid_cursor(self):
+        response = APIClient().get('/api/recipes/?cursor=bm9wZQ')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.json())
+
+
+class ImageUploadTest(SimpleTestCase):
+    """Слишком большие по стороне картинки уменьшаются"""
+
+    @staticmethod
+    def encode(size):
+        content = BytesIO()
+        Image.new('RGB', size, 'red').save(content, 'PNG')
+        encoded = base64.b64encode(content.getvalue()).decode()
+        return f'data:image/png;base64,{encoded}'
+
+    @override_settings(RECIPE_IMAGE_MAX_DIMENSION=64)
+    def test_oversized_image_is_downscaled(self):
+        file = decode_base64_image(self.encode((256, 128)))
+        self.assertTrue(file.name.endswith('.png'))
+        with Image.open(file) as image:
+            self.assertEqual(image.size, (64, 32))
+
+    @override_settings(RECIPE_IMAGE_MAX_DIMENSION=64)
+    def test_small_image_is_kept(self):
+        file = decode_base64_image(self.encode((32, 16)))
+        with Image.open(file) as image:
+            self.assertEqual(image.size, (32, 16))
+
+
+class SearchIndexTest(TestCase):
+    """Поиск видит переименование ингредиента"""
+
+    def test_ingredient_rename(self):
+        author = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x')
+        ingredient = Ingredient.objects.create(
+            name='картофель', measurement_unit='г')
+        recipe = Recipe.objects.create(
+            author=author, name='пюре', text='текст',
+            image='recipes/temp.png', cooking_time=5)
+        IngredientInRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=100)
+        index_recipe(recipe)
+        ingredient.name = 'батат'
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.save()
+        found = search_recipes(Recipe.objects.all(), 'батат')
+        self.assertEqual(list(found.values_list('pk', flat=True)),
+                         [recipe.pk])
+        self.assertFalse(search_recipes(Recipe.objects.all(), 'картофель'))
+
+
+class CookableTest(TestCase):
+    """Поиск рецептов по имеющимся ингредиентам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'продукт {number}', measurement_unit='г')
+            for number in range(4)
+        ]
+        cls.recipes = []
+        for number, size in enumerate((1, 2, 4)):
+            recipe = Recipe.objects.create(
+                author=author, name=f'рецепт {number}', text='текст',
+                image='recipes/temp.png', cooking_time=5)
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+                for ingredient in cls.ingredients[:size]
+            )
+            sync_recipe(recipe)
+            cls.recipes.append(recipe)
+
+    def get(self, query):
+        response = APIClient().get(f'/api/recipes/cookable/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_ranking(self):
+        ids = ','.join(str(item.pk) for item in self.ingredients[:2])
+        results = self.get(f'ingredients={ids}')
+        self.assertEqual(
+            [(item['id'], item['coverage']) for item in results],
+            [(self.recipes[1].pk, 1.0), (self.recipes[0].pk, 1.0),
+             (self.recipes[2].pk, 0.5)]
+        )
+        page = self.get(f'ingredients={ids}&limit=1&page=3')
+        self.assertEqual(page['count'], 3)
+        self.assertEqual(page['results'][0]['id'], self.recipes[2].pk)
+        full = self.get(f'ingredients={ids}&full=1')
+        self.assertEqual(len(full), 2)
+
+    def test_index_follows_recipe_changes(self):
+        recipe = self.recipes[2]
+        IngredientInRecipe.objects.filter(
+            recipe=recipe, ingredient__in=self.ingredients[2:]).delete()
+        sync_recipe(recipe)
+        ids = ','.join(str(item.pk) for item in self.ingredients[:2])
+        self.assertEqual(len(self.get(f'ingredients={ids}&full=1')), 3)
+        self.recipes[0].delete()
+        self.assertEqual(len(self.get(f'ingredients={ids}')), 2)
+
+    def test_queries(self):
+        ids = ','.join(str(item.pk) for item in self.ingredients)
+        with self.assertNumQueries(3):
+            self.get(f'ingredients={ids}&limit=2')
+
+
+class RecipeUpdateTest(TestCase):
+    """PATCH меняет только отличающиеся строки состава"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x')
+        cls.tags = [
+            Tag.objects.create(
+                name=f'тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}')
+            for number in range(2)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(8)
+        )
+        cls.ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+        cls.recipes = []
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'рецепт {number}', text='текст',
+                image='recipes/temp.png', cooking_time=5)
+            recipe.tags.set(cls.tags)
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(recipe=recipe, ingredient_id=pk, amount=10)
+                for pk in cls.ingredients[:4]
+            )
+            sync_recipe(recipe)
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def rows(self, recipe):
+        return {
+            item.ingredient_id: (item.pk, item.amount)
+            for item in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+
+    def patch(self, recipe, amounts):
+        ingredients = [{'id': self.ingredients[index], 'amount': amount}
+                       for index, amount in amounts.items()]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/', {'ingredients': ingredients},
+                format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(context)
+
+    def test_diff(self):
+        recipe = self.recipes[0]
+        before = self.rows(recipe)
+        self.patch(recipe, {1: 20, 2: 10, 3: 10, 4: 5})
+        after = self.rows(recipe)
+        pks = self.ingredients
+        self.assertEqual(
+            {pk: amount for pk, (_, amount) in after.items()},
+            {pks[1]: 20, pks[2]: 10, pks[3]: 10, pks[4]: 5})
+        for pk in pks[1:4]:
+            self.assertEqual(after[pk][0], before[pk][0])
+        self.assertEqual(set(recipe.tags.all()), set(self.tags))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredients_count, 4)
+
+    def test_omitted_collections(self):
+        recipe = self.recipes[0]
+        before = self.rows(recipe)
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/', {'name': 'новое'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rows(recipe), before)
+        self.assertEqual(set(recipe.tags.all()), set(self.tags))
+
+    def test_queries(self):
+        self.patch(self.recipes[2], {0: 10, 1: 10, 2: 10, 3: 11})
+        small = self.patch(self.recipes[0], {1: 20, 2: 10, 3: 10, 4: 5})
+        large = self.patch(
+            self.recipes[1], {2: 20, 3: 20, 4: 5, 5: 5, 6: 5, 7: 5})
+        self.assertEqual(small, large)
+
+
+class BatchRelationsTest(TestCase):
+    """Массовое удаление из избранного: один DELETE и точный счётчик"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@test.ru', password='x')
+        author = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'рецепт {number}', text='текст',
+                image='recipes/temp.png', cooking_time=5)
+            for number in range(10)
+        ]
+
+    def delete_queries(self, client, recipes):
+        payload = {'recipes': [recipe.pk for recipe in recipes]}
+        client.post('/api/recipes/favorite/batch/', payload, format='json')
+        with CaptureQueriesContext(connection) as context:
+            response = client.delete(
+                '/api/recipes/favorite/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {item['status'] for item in response.json()['results']},
+            {'removed'})
+        return len(context)
+
+    def test_delete(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(
+            self.delete_queries(client, self.recipes[:2]),
+            self.delete_queries(client, self.recipes))
+        self.assertEqual(
+            set(Recipe.objects.values_list('favorites_count', flat=True)),
+            {0})
+        self.assertFalse(Favourite.objects.exists())
+
+
+class AuthorVersionTest(TestCase):
+    """Версию пользователей в кеше выдачи меняют только поля автора"""
+
+    def save(self, user, **kwargs):
+        before = get_version(User)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(**kwargs)
+        return get_version(User) != before
+
+    def test_bumps(self):
+        user = User(username='cook', email='cook@test.ru', first_name='А')
+        self.assertFalse(self.save(user))
+        user.set_password('new-password')
+        self.assertFalse(self.save(user))
+        self.assertFalse(self.save(user, update_fields=['last_login']))
+        user.first_name = 'Б'
+        self.assertTrue(self.save(user))
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=1, FEED_MAX_ENTRIES=2)
+class FeedTest(TestCase):
+    """Лента подписок: fan-out, порог подписчиков и глубина ленты"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.readers = [
+            User.objects.create_user(
+                username=f'reader{number}', email=f'reader{number}@test.ru',
+                password='x')
+            for number in range(2)
+        ]
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'рецепт {number}', text='текст',
+                image='recipes/temp.png', cooking_time=5)
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def subscribe(self, reader):
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscribtions.objects.create(user=reader, author=self.author)
+
+    def feed(self, reader):
+        return [pk for _, pk in read_feed(reader, None, 10)]
+
+    def test_threshold_and_trim(self):
+        newest = [recipe.pk for recipe in reversed(self.recipes)]
+        self.subscribe(self.readers[0])
+        self.assertEqual(self.feed(self.readers[0]), newest[:2])
+        with self.assertNumQueries(1):
+            self.feed(self.readers[0])
+        self.subscribe(self.readers[1])
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed(self.readers[1]), newest)
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscribtions.objects.filter(user=self.readers[1]).delete()
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.readers[0]).count(), 3)
+        self.assertEqual(trim_feeds(), 1)
+        self.assertEqual(self.feed(self.readers[0]), newest[:2])
+
+
+class TokenCacheTest(TestCase):
+    """Кешируются поля пользователя без счётчиков и пароля"""
+
+    def test_uncached_fields(self):
+        user = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x')
+        token = Token.objects.create(user=user)
+        cache.clear()
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(token.key)
+        Recipe.objects.create(
+            author=user, name='рецепт', text='текст',
+            image='recipes/temp.png', cooking_time=5)
+        with self.assertNumQueries(0):
+            cached, _ = authentication.authenticate_credentials(token.key)
+        self.assertEqual(cached.username, 'cook')
+        self.assertEqual(cached.recipes_count, 1)
+        values = cache.get(get_cache_key(token.key))
+        self.assertNotIn(user.password, values)
+        self.assertNotIn('password', CACHED_FIELDS)
+        self.assertTrue(cached.check_password('x'))
+        cached.first_name = 'Повар'
+        cached.save()
+        user.refresh_from_db()
+        self.assertEqual(user.first_name, 'Повар')
+        self.assertEqual(user.recipes_count, 1)
+
+    def test_set_password(self):
+        user = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x')
+        token = Token.objects.create(user=user)
+        client = APIClient(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+        response = client.post('/api/users/set_password/', {
+            'current_password': 'x', 'new_password': 'Nov0e-parol'})
+        self.assertEqual(response.status_code, 204, response.content)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('Nov0e-parol'))
+
+
+class RecipeOrderingTest(TestCase):
+    """Сортировки newest, popular и trending; вес добавлений убывает"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x')
+        readers = [
+            User.objects.create_user(
+                username=f'reader{number}', email=f'reader{number}@test.ru',
+                password='x')
+            for number in range(4)
+        ]
+        cls.recipes = {
+            name: Recipe.objects.create(
+                author=author, name=name, text='текст',
+                image='recipes/temp.png', cooking_time=5)
+            for name in ('old', 'recent', 'stale', 'fresh')
+        }
+        cls.now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        # (рецепт, добавлений в избранное, часов назад)
+        for name, count, hours in (('old', 3, 30), ('recent', 2, 0),
+                                   ('stale', 4, 24 * 10), ('fresh', 1, 0)):
+            for reader in readers[:count]:
+                Favourite.objects.create(
+                    user=reader, recipe=cls.recipes[name])
+            Favourite.objects.filter(recipe=cls.recipes[name]).update(
+                created=cls.now - timedelta(hours=hours))
+        ShoppingList.objects.create(
+            user=readers[0], recipe=cls.recipes['fresh'])
+
+    def setUp(self):
+        cache.clear()
+
+    def ordered(self, ordering):
+        response = APIClient().get(f'/api/recipes/?ordering={ordering}')
+        return [recipe['name'] for recipe in response.json()]
+
+    def test_decay(self):
+        scores = compute_scores(self.now)
+        self.assertEqual(scores.keys(), {
+            self.recipes[name].pk for name in ('old', 'recent', 'fresh')})
+        self.assertAlmostEqual(
+            scores[self.recipes['old'].pk], 3 * 0.5 ** (30 / 24))
+        self.assertAlmostEqual(scores[self.recipes['recent'].pk], 2)
+        self.assertAlmostEqual(scores[self.recipes['fresh'].pk], 1.5)
+
+    def test_orderings(self):
+        self.assertEqual(rebuild_trending(), 3)
+        self.assertEqual(self.ordered('trending'),
+                         ['recent', 'fresh', 'old', 'stale'])
+        self.assertEqual(self.ordered('popular'),
+                         ['stale', 'old', 'recent', 'fresh'])
+        self.assertEqual(self.ordered('newest'),
+                         ['fresh', 'stale', 'recent', 'old'])
+
+    def test_cache_follows_favourites_and_trends(self):
+        self.assertEqual(self.ordered('trending'),
+                         ['fresh', 'stale', 'recent', 'old'])
+        call_command('compute_trending', stdout=StringIO())
+        self.assertEqual(self.ordered('trending'),
+                         ['recent', 'fresh', 'old', 'stale'])
+        self.assertEqual(self.ordered('popular')[0], 'stale')
+        with self.captureOnCommitCallbacks(execute=True):
+            Favourite.objects.filter(recipe=self.recipes['stale']).delete()
+        self.assertEqual(self.ordered('popular')[0], 'old')
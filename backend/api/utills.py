@@ -1,8 +1,13 @@
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.response import Response
 
-from recipes.models import Recipe
+from recipes.counters import delete_rows, recount
+from recipes.models import Favourite, Recipe, ShoppingList
+from .reference_cache import bump_version
+from .relations import get_relations
+from .shopping_cart import invalidate_shopping_cart
 
 
 def add_and_del(self, request, serializer, model, **kwargs):
@@ -15,19 +20,74 @@ def add_and_del(self, request, serializer, model, **kwargs):
     if request.method == "POST":
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        get_relations(request).remember(model, recipe.pk, True)
         return Response(
             status=status.HTTP_201_CREATED,
             data=self.get_serializer(recipe).data
         )
-    model = model.objects.filter(
+    relation = model.objects.filter(
         recipe=recipe, user=request.user
     )
-    if not model.exists():
+    if not relation.exists():
         return Response(
             {'errors': 'В списке нет этого рецепта'},
             status=status.HTTP_400_BAD_REQUEST,
         )
-    model.delete()
+    relation.delete()
+    get_relations(request).remember(model, recipe.pk, False)
     return Response(
         {'errors': 'Успешное удаление рецепта'},
         status=status.HTTP_204_NO_CONTENT)
+
+
+def add_and_del_many(request, serializer, model, counter):
+    """
+    Добавляет или убирает пачку рецептов одним INSERT и одним DELETE.
+    Ни bulk_create, ни delete_rows не отправляют сигналы, поэтому счётчик
+    counter, кэш списка покупок и версия избранного обновляются здесь.
+    """
+    serializer = serializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['recipes']
+    user = request.user
+    found = set(Recipe.objects.filter(
+        pk__in=ids).values_list('pk', flat=True))
+    with transaction.atomic():
+        present = set(model.objects.filter(
+            user=user, recipe_id__in=found
+        ).values_list('recipe_id', flat=True))
+        if request.method == 'POST':
+            changed = found - present
+            model.objects.bulk_create(
+                [model(user=user, recipe_id=pk) for pk in changed],
+                ignore_conflicts=True
+            )
+            statuses = ('added', 'exists')
+        else:
+            changed = present
+            delete_rows(model, 'user', user.pk, 'recipe', changed)
+            statuses = ('removed', 'absent')
+        recount(Recipe, counter, model, 'recipe', changed)
+        relations = get_relations(request)
+        for pk in changed:
+            relations.remember(model, pk, request.method == 'POST')
+        if changed and model is ShoppingList:
+            transaction.on_commit(lambda: invalidate_shopping_cart([user.pk]))
+        if changed and model is Favourite:
+            transaction.on_commit(lambda: bump_version(Favourite))
+    results = []
+    for pk in ids:
+        if pk not in found:
+            result = 'not_found'
+        else:
+            result = statuses[0] if pk in changed else statuses[1]
+        results.append({'id': pk, 'status': result})
+    return Response({'results': results})
+
+
+def get_recipes_limit(request):
+    """Достаёт из запроса положительный recipes_limit или None"""
+    limit = request.query_params.get('recipes_limit')
+    if limit is None or not limit.isdigit() or int(limit) <= 0:
+        return None
+    return int(limit)
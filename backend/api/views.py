@@ -1,36 +1,51 @@
 from django.contrib.auth import update_session_auth_hash
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from django.core.exceptions import ValidationError
+from django.db.models import BooleanField, Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.serializers import SetPasswordSerializer
-from rest_framework import filters, mixins, status, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
-from recipes.models import (Favourite, Ingredient, IngredientInRecipe, Recipe,
+from core.metrics import SerializerMetricsMixin, timed_serializer
+from recipes.cookable import rank_by_coverage
+from recipes.feed import read_feed
+from recipes.models import (Favourite, FeedEntry, Ingredient, Recipe,
                             ShoppingList, Tag)
 from users.models import Subscribtions, User
-from .filters import IngredientFilter, RecipeFilter
+from .autocomplete import MAX_RESULTS
+from .conditional import (get_validators, is_not_modified,
+                          not_modified_response, set_validators,
+                          with_signature_fields)
+from .feed_cache import AnonymousResponseCacheMixin
+from .filters import RECIPE_ORDERINGS, IngredientFilter, RecipeFilter
 from .pagination import PageLimitPagination
 from .permissions import IsAuthorOrAdminOrReadOnly
-from .serializers import (FavoriteSerializer, IngredientSerializer,
-                          RecipeGetSerializer, RecipePostSerializer,
-                          RecipeShortSerializer, ShoppingCartSerializer,
-                          SubscriptionSerializer, TagSerializer,
-                          UserGetSerializer, UserPostSerializer,
+from .reference_cache import ReferenceDataCacheMixin
+from .relations import get_relations
+from .serializers import (CookableQuerySerializer, FavoriteSerializer,
+                          IngredientSerializer, RecipeBatchSerializer,
+                          RecipeCoverageSerializer, RecipeGetSerializer,
+                          RecipePostSerializer, RecipeShortSerializer,
+                          ShoppingCartSerializer, SubscriptionSerializer,
+                          TagSerializer, UserGetSerializer, UserPostSerializer,
                           UserWithRecipesSerializer)
-from .utills import add_and_del
+from .shopping_cart import FORMATS, get_ingredients
+from .utills import add_and_del, add_and_del_many, get_recipes_limit
 
 
 class CustomUserViewSet(
-        mixins.CreateModelMixin, mixins.ListModelMixin,
-        mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+        SerializerMetricsMixin, mixins.CreateModelMixin,
+        mixins.ListModelMixin, mixins.RetrieveModelMixin,
+        viewsets.GenericViewSet):
     """Класс управления пользователями"""
     queryset = User.objects.all()
     pagination_class = PageLimitPagination
+    keyset_ordering = ('pk', )
 
     def get_instance(self):
         return self.request.user
@@ -69,21 +84,28 @@ class CustomUserViewSet(
         permission_classes=[IsAuthenticated]
     )
     def subscriptions(self, request):
+        limit = get_recipes_limit(request)
         users = User.objects.filter(
             following__user=request.user
-        ).prefetch_related('recipes')
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.limited_per_author(
+                    limit).order_by('-pk'),
+                to_attr='limited_recipes'
+            )
+        ).order_by('pk')
         page = self.paginate_queryset(users)
         if page is not None:
-            serializer = UserWithRecipesSerializer(
+            serializer = timed_serializer(UserWithRecipesSerializer(
                 page, many=True,
-                context={'request': request})
+                context={'request': request}), request)
             return self.get_paginated_response(serializer.data)
-        serializer = UserWithRecipesSerializer(
-            users, many=True, context={'request': request}
-        )
-        return Response(UserWithRecipesSerializer(
+        return Response(timed_serializer(UserWithRecipesSerializer(
             users, many=True, context={'request': request}
-        ).data)
+        ), request).data)
 
     @action(
         ["POST", "DELETE"],
@@ -100,6 +122,7 @@ class CustomUserViewSet(
         if request.method == "POST":
             serializer.is_valid(raise_exception=True)
             serializer.save()
+            get_relations(request).remember(Subscribtions, user.pk, True)
             return Response(
                 status=status.HTTP_201_CREATED,
                 data=self.get_serializer(user).data
@@ -113,28 +136,39 @@ class CustomUserViewSet(
                 status=status.HTTP_400_BAD_REQUEST,
             )
         subscription.delete()
+        get_relations(request).remember(Subscribtions, user.pk, False)
         return Response(
             {'errors': 'Успешная отписка'},
             status=status.HTTP_204_NO_CONTENT)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(SerializerMetricsMixin, ReferenceDataCacheMixin,
+                        ReadOnlyModelViewSet):
     """Обработка операций с ингредиентами"""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter)
+    filter_backends = (DjangoFilterBackend, )
     filterset_class = IngredientFilter
 
+    def filter_queryset(self, queryset):
+        """Подсказки по name ограничены; retrieve срез не получает"""
+        queryset = super().filter_queryset(queryset)
+        if (self.action == 'list'
+                and self.request.query_params.get('name', '').strip()):
+            return queryset[:MAX_RESULTS]
+        return queryset
 
-class TagViewSet(ReadOnlyModelViewSet):
+
+class TagViewSet(SerializerMetricsMixin, ReferenceDataCacheMixin,
+                 ReadOnlyModelViewSet):
     """Обработка операций с тегами"""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SerializerMetricsMixin, AnonymousResponseCacheMixin,
+                    viewsets.ModelViewSet):
     """Обработка операций связанная с рецептами"""
-    queryset = Recipe.objects.all()
     permission_classes = [IsAuthorOrAdminOrReadOnly]
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
@@ -147,6 +181,72 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeShortSerializer
         return RecipePostSerializer
 
+    @property
+    def keyset_ordering(self):
+        """
+        Постраничный вывод по ключу доступен для newest и popular без
+        поиска: поиск сортирует по рангу, которого нет в курсоре.
+        """
+        params = self.request.query_params
+        ordering = params.get('ordering', 'newest')
+        if (self.action == 'list' and ordering in ('newest', 'popular')
+                and not params.get('search')):
+            return RECIPE_ORDERINGS[ordering]
+        return None
+
+    def get_queryset(self):
+        user = self.request.user
+        return Recipe.objects.with_related(user).with_user_flags(user)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            self.conditional_list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            self.conditional_retrieve, request, *args, **kwargs)
+
+    def conditional_list(self, request, *args, **kwargs):
+        queryset = with_signature_fields(
+            self.filter_queryset(self.get_queryset()), request.user,
+            self.keyset_ordering or ())
+        page = self.paginate_queryset(queryset)
+        paginated = page is not None
+        if not paginated:
+            page = list(queryset)
+            extra = len(page)
+        elif self.paginator.keyset:
+            extra = self.paginator.get_next_link()
+        else:
+            extra = self.paginator.page.paginator.count
+        etag, last_modified = get_validators(page, extra)
+        if is_not_modified(request, etag):
+            return not_modified_response(etag, last_modified)
+        recipes = self.get_queryset().in_bulk(
+            [recipe.pk for recipe in page])
+        serializer = self.get_serializer(
+            [recipes[recipe.pk] for recipe in page], many=True)
+        if paginated:
+            response = self.get_paginated_response(serializer.data)
+        else:
+            response = Response(serializer.data)
+        return set_validators(response, etag, last_modified)
+
+    def conditional_retrieve(self, request, *args, **kwargs):
+        # Как get_object_or_404 в DRF: кривой pk - это 404, а не 500
+        try:
+            recipes = list(with_signature_fields(
+                self.get_queryset().filter(pk=kwargs['pk']), request.user))
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        if not recipes:
+            return super().retrieve(request, *args, **kwargs)
+        etag, last_modified = get_validators(recipes)
+        if is_not_modified(request, etag):
+            return not_modified_response(etag, last_modified)
+        return set_validators(
+            super().retrieve(request, *args, **kwargs), etag, last_modified)
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
@@ -171,25 +271,79 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(
         detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='favorite/batch',
         permission_classes=[IsAuthenticated]
     )
-    def download_shopping_cart(self, request):
-        user = request.user
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping__user=user).values(
-            name=F('ingredient__name'),
-            measurement_unit=F('ingredient__measurement_unit')).annotate(
-            number=Sum('amount')
+    def favorite_batch(self, request):
+        return add_and_del_many(
+            request, RecipeBatchSerializer, Favourite, 'favorites_count')
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_batch(self, request):
+        return add_and_del_many(
+            request, RecipeBatchSerializer, ShoppingList, 'in_carts_count')
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые сверху, постранично по ключу"""
+        positions = self.paginator.paginate_positions(
+            request, ('-created', '-recipe_id'), FeedEntry,
+            lambda position, count: read_feed(request.user, position, count)
+        )
+        recipes = self.get_queryset().in_bulk(
+            [pk for _, pk in positions])
+        serializer = timed_serializer(RecipeGetSerializer(
+            [recipes[pk] for _, pk in positions if pk in recipes],
+            many=True, context=self.get_serializer_context()
+        ), request)
+        return self.paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False)
+    def cookable(self, request):
+        """Рецепты по убыванию доли ингредиентов, имеющихся у пользователя"""
+        params = CookableQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        ranked = rank_by_coverage(
+            params.validated_data['ingredients'],
+            full=params.validated_data['full']
         )
-        data = []
-        for ingredient in ingredients:
-            data.append(
-                f'{ingredient["name"]} - '
-                f'{ingredient["number"]} '
-                f'{ingredient["measurement_unit"]}'
+        page = self.paginate_queryset(ranked)
+        ranked = list(ranked if page is None else page)
+        recipes = Recipe.objects.in_bulk([pk for pk, _ in ranked])
+        # Рецепт могли удалить после чтения индекса
+        found = []
+        for pk, coverage in ranked:
+            if pk in recipes:
+                recipes[pk].coverage = coverage
+                found.append(recipes[pk])
+        serializer = timed_serializer(RecipeCoverageSerializer(
+            found, many=True,
+            context=self.get_serializer_context()
+        ), request)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated]
+    )
+    def download_shopping_cart(self, request):
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in FORMATS:
+            return Response(
+                {'errors': f'Доступные форматы: {", ".join(FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        content = 'Список покупок:\n\n' + '\n'.join(data)
-        filename = 'Shopping_cart.txt'
-        request = HttpResponse(content, content_type='text/plain')
-        request['Content-Disposition'] = f'attachment; filename={filename}'
-        return request
+        render, content_type = FORMATS[file_format]
+        content = render(get_ingredients(request.user))
+        filename = f'Shopping_cart.{file_format}'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename={filename}'
+        return response
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import checks  # noqa: F401
+        if settings.DB_CONN_HEALTH_CHECKS:
+            from .db import reset_health_checks
+            request_started.connect(reset_health_checks)
@@ -0,0 +1,25 @@
+from django.db.backends.postgresql import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL с проверкой постоянного соединения, как CONN_HEALTH_CHECKS
+    в Django 4.1: в начале запроса core.db.reset_health_checks сбрасывает
+    флаг, и SELECT 1 уходит только при первом обращении к базе в этом
+    запросе. Соединение, которое postgres или pgbouncer успели закрыть,
+    открывается заново вместо ошибки; базы, к которым запрос не
+    обращался, не проверяются.
+    """
+    # Вне запросов (команды, потоки обработки картинок) проверки нет
+    health_check_done = True
+
+    def ensure_connection(self):
+        if not self.health_check_done:
+            self.health_check_done = True
+            if (
+                self.connection is not None
+                and not self.in_atomic_block
+                and not self.is_usable()
+            ):
+                self.close()
+        super().ensure_connection()
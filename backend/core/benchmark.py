@@ -0,0 +1,269 @@
+import base64
+import io
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.shopping_cart import invalidate_shopping_cart
+from recipes.cookable import rebuild_postings
+from recipes.models import (Favourite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingList, Tag)
+from users.models import Subscribtions, User
+
+BATCH_SIZE = 2000
+SYLLABLES = (
+    'ба', 'ве', 'го', 'да', 'ка', 'ла', 'ма', 'но', 'пе', 'ри', 'со', 'ту',
+    'фа', 'хо', 'ца', 'чи', 'ша', 'ян',
+)
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.')
+TAGS = 3
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class Sizes:
+    users: int = 200
+    recipes: int = 2000
+    ingredients: int = 2000
+    ingredients_per_recipe: int = 8
+    favorites_per_user: int = 20
+    carts_per_user: int = 10
+    subscriptions_per_user: int = 10
+
+
+def bulk_create(model, objects):
+    for start in range(0, len(objects), BATCH_SIZE):
+        model.objects.bulk_create(objects[start:start + BATCH_SIZE])
+
+
+def seed_dataset(sizes, rand, prefix):
+    """
+    Синтетические данные одним bulk_create на модель. SQLite в Django 3.2
+    не возвращает id после bulk_create, поэтому объекты перечитываются
+    по уникальному префиксу.
+    """
+    password = make_password(None)
+    bulk_create(User, [
+        User(username=f'{prefix}{number}', email=f'{prefix}{number}@bench.ru',
+             first_name='Бенч', last_name=str(number), password=password)
+        for number in range(sizes.users)
+    ])
+    users = list(User.objects.filter(
+        username__startswith=prefix).values_list('pk', flat=True))
+    bulk_create(Tag, [
+        Tag(name=f'{prefix}{number}', color=f'#{rand.randrange(16 ** 6):06x}',
+            slug=f'{prefix}{number}')
+        for number in range(TAGS)
+    ])
+    tags = list(Tag.objects.filter(slug__startswith=prefix))
+    bulk_create(Ingredient, [
+        Ingredient(
+            name=''.join(rand.choices(SYLLABLES, k=3)) + f' {prefix}{number}',
+            measurement_unit=rand.choice(UNITS)
+        )
+        for number in range(sizes.ingredients)
+    ])
+    ingredients = list(Ingredient.objects.filter(
+        name__contains=f' {prefix}').values_list('pk', flat=True))
+    bulk_create(Recipe, [
+        Recipe(author_id=rand.choice(users), name=f'{prefix} рецепт {number}',
+               text='Синтетический рецепт', image='recipes/benchmark.png',
+               cooking_time=rand.randint(1, 120))
+        for number in range(sizes.recipes)
+    ])
+    recipes = list(Recipe.objects.filter(
+        name__startswith=f'{prefix} ').values_list('pk', flat=True))
+    through = Recipe.tags.through
+    bulk_create(through, [
+        through(recipe_id=recipe, tag_id=tag.pk)
+        for recipe in recipes for tag in rand.sample(tags, 2)
+    ])
+    bulk_create(IngredientInRecipe, [
+        IngredientInRecipe(recipe_id=recipe, ingredient_id=ingredient,
+                           amount=rand.randint(1, 500))
+        for recipe in recipes
+        for ingredient in rand.sample(
+            ingredients, min(sizes.ingredients_per_recipe, len(ingredients)))
+    ])
+    for model, per_user in ((Favourite, sizes.favorites_per_user),
+                            (ShoppingList, sizes.carts_per_user)):
+        bulk_create(model, [
+            model(user_id=user, recipe_id=recipe)
+            for user in users
+            for recipe in rand.sample(recipes, min(per_user, len(recipes)))
+        ])
+    bulk_create(Subscribtions, [
+        Subscribtions(user_id=user, author_id=author)
+        for user in users
+        for author in rand.sample(
+            users, min(sizes.subscriptions_per_user + 1, len(users)))
+        if author != user
+    ])
+    # bulk_create не отправляет сигналы, индекс продуктов собирается целиком
+    rebuild_postings()
+    return {
+        'users': list(User.objects.filter(pk__in=users)),
+        'tags': tags,
+        'ingredients': ingredients,
+        'recipes': recipes,
+    }
+
+
+def make_image():
+    content = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 40)).save(content, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        content.getvalue()).decode()
+
+
+def recipe_payload(data, rand, image):
+    return {
+        'name': 'Бенчмарк',
+        'text': 'Рецепт из бенчмарка',
+        'cooking_time': rand.randint(1, 120),
+        'image': image,
+        'tags': [tag.pk for tag in rand.sample(data['tags'], 2)],
+        'ingredients': [
+            {'id': pk, 'amount': rand.randint(1, 500)}
+            for pk in rand.sample(data['ingredients'], 10)
+        ],
+    }
+
+
+@dataclass
+class Scenario:
+    """
+    Запрос к API: build(client, data, rand) возвращает ответ; prepare с
+    теми же аргументами выполняется перед замером.
+    """
+    name: str
+    build: Callable
+    prepare: Optional[Callable] = None
+
+
+def get(url):
+    def request(client, data, rand):
+        return client.get(url(data, rand))
+    return request
+
+
+def clear_shopping_cart_cache(client, data, rand):
+    """Иначе все прогоны, кроме первого, замеряют попадание в кеш"""
+    invalidate_shopping_cart([data['user'].pk])
+
+
+def download_shopping_cart(client, data, rand):
+    response = client.get('/api/recipes/download_shopping_cart/')
+    b''.join(response.streaming_content)
+    return response
+
+
+def create_recipe(client, data, rand):
+    response = client.post(
+        '/api/recipes/', recipe_payload(data, rand, data['image']),
+        format='json')
+    data['created'].append((response.data['id'], data['user']))
+    return response
+
+
+def update_recipe(client, data, rand):
+    pk, author = rand.choice(data['created'])
+    client.force_authenticate(author)
+    return client.patch(
+        f'/api/recipes/{pk}/', recipe_payload(data, rand, data['image']),
+        format='json')
+
+
+SCENARIOS = (
+    Scenario('recipes_list', get(
+        lambda data, rand: f'/api/recipes/?limit=6&page={rand.randint(1, 20)}'
+    )),
+    Scenario('recipes_filtered', get(
+        lambda data, rand: (
+            f'/api/recipes/?limit=6&tags={rand.choice(data["tags"]).slug}'
+            '&is_favorited=1'
+        )
+    )),
+    Scenario('subscriptions', get(
+        lambda data, rand: '/api/users/subscriptions/?limit=6&recipes_limit=3'
+    )),
+    Scenario('download_shopping_cart', download_shopping_cart,
+             clear_shopping_cart_cache),
+    Scenario('ingredient_autocomplete', get(
+        lambda data, rand: (
+            '/api/ingredients/?name='
+            + ''.join(rand.choices(SYLLABLES, k=rand.randint(1, 2)))
+        )
+    )),
+    Scenario('cookable', get(
+        lambda data, rand: (
+            '/api/recipes/cookable/?limit=6&ingredients='
+            + ','.join(map(str, rand.sample(data['ingredients'], 20)))
+        )
+    )),
+    Scenario('recipe_create', create_recipe),
+    Scenario('recipe_update', update_recipe),
+)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percent // 100)]
+
+
+def run_scenario(scenario, data, rand, iterations):
+    """Первый прогон прогревает кеши и в статистику не попадает"""
+    client = APIClient()
+    timings = []
+    queries = []
+    for iteration in range(iterations + 1):
+        data['user'] = rand.choice(data['users'])
+        client.force_authenticate(data['user'])
+        if scenario.prepare:
+            scenario.prepare(client, data, rand)
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = scenario.build(client, data, rand)
+            elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f'{scenario.name}: ответ {response.status_code}')
+        if iteration:
+            timings.append(elapsed)
+            queries.append(len(context))
+    result = {
+        f'p{percent}_ms': round(percentile(timings, percent), 3)
+        for percent in PERCENTILES
+    }
+    result.update(
+        max_ms=round(max(timings), 3),
+        queries_max=max(queries),
+        queries_mean=round(sum(queries) / len(queries), 2),
+        iterations=iterations,
+    )
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно сохранённого baseline"""
+    regressions = []
+    for name, expected in baseline.get('scenarios', {}).items():
+        actual = results['scenarios'].get(name)
+        if actual is None:
+            continue
+        limit = expected['p95_ms'] * (1 + tolerance)
+        if actual['p95_ms'] > limit:
+            regressions.append(
+                f'{name}: p95 {actual["p95_ms"]} мс > {limit:.3f} мс')
+        if actual['queries_max'] > expected['queries_max']:
+            regressions.append(
+                f'{name}: запросов {actual["queries_max"]} > '
+                f'{expected["queries_max"]}'
+            )
+    return regressions
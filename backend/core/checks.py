@@ -0,0 +1,61 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Gunicorn берёт число воркеров из этой переменной окружения
+WORKERS_ENV = 'WEB_CONCURRENCY'
+
+
+@register()
+def check_connection_budget(app_configs, **kwargs):
+    """
+    Постоянные соединения держатся каждым воркером gunicorn и каждым
+    потоком обработки картинок; их сумма не должна упираться в
+    max_connections postgres. В режиме pgbouncer соединения к базе
+    ограничивает он сам.
+    """
+    if settings.DB_CONNECTION_MODE != 'persistent':
+        return []
+    workers = int(os.getenv(WORKERS_ENV, 1))
+    needed = workers * (1 + settings.IMAGE_PIPELINE_WORKERS)
+    if needed < settings.DB_MAX_CONNECTIONS:
+        return []
+    return [Warning(
+        f'{workers} воркеров gunicorn держат до {needed} постоянных '
+        f'соединений при DB_MAX_CONNECTIONS={settings.DB_MAX_CONNECTIONS}',
+        hint='Уменьшите WEB_CONCURRENCY или используйте '
+             'DB_CONNECTION_MODE=pgbouncer',
+        id='core.W001',
+    )]
+
+
+@register()
+def check_pdf_font(app_configs, **kwargs):
+    """Без шрифта с кириллицей выгрузка списка покупок в pdf падает"""
+    if os.path.exists(settings.SHOPPING_CART_PDF_FONT):
+        return []
+    return [Warning(
+        f'Нет шрифта {settings.SHOPPING_CART_PDF_FONT}',
+        hint='Установите fonts-dejavu-core или задайте '
+             'SHOPPING_CART_PDF_FONT',
+        id='core.W002',
+    )]
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Версии кешей и сброс токенов хранятся в общем кеше: с LocMemCache
+    изменение в одном воркере не видно остальным.
+    """
+    workers = int(os.getenv(WORKERS_ENV, 1))
+    backend = settings.CACHES['default']['BACKEND']
+    if workers == 1 or not backend.endswith('LocMemCache'):
+        return []
+    return [Warning(
+        f'{workers} воркеров gunicorn с кешем в памяти процесса: '
+        'справочники, лента и токены устаревают до истечения кеша',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION общего кеша',
+        id='core.W003',
+    )]
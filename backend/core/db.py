@@ -0,0 +1,10 @@
+from django.db import connections
+
+
+def reset_health_checks(**kwargs):
+    """
+    request_started: соединения core.backends.postgresql проверятся при
+    первом обращении в этом запросе
+    """
+    for connection in connections.all():
+        connection.health_check_done = False
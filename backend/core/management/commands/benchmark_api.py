@@ -0,0 +1,100 @@
+import json
+import random
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+
+from core.benchmark import (SCENARIOS, Sizes, compare, make_image,
+                            run_scenario, seed_dataset)
+from recipes.models import Recipe
+
+ITERATIONS = 50
+TOLERANCE = 0.5
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержки и число запросов основных эндпоинтов API на '
+            'синтетических данных. Данные создаются в транзакции и '
+            'откатываются, файлы пишутся во временную папку. С --baseline '
+            'падает при регрессии.')
+
+    def add_arguments(self, parser):
+        defaults = Sizes()
+        for field in Sizes.__dataclass_fields__:
+            parser.add_argument(
+                f'--{field.replace("_", "-")}', type=int,
+                default=getattr(defaults, field)
+            )
+        parser.add_argument('--iterations', type=int, default=ITERATIONS)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--scenario', action='append',
+            choices=[scenario.name for scenario in SCENARIOS],
+            help='Запустить только эти сценарии (можно повторять)'
+        )
+        parser.add_argument('--output', help='Куда записать результаты JSON')
+        parser.add_argument(
+            '--baseline', help='JSON с прошлого прогона для сравнения')
+        parser.add_argument(
+            '--tolerance', type=float, default=TOLERANCE,
+            help='Допустимый рост p95 относительно baseline, доля'
+        )
+
+    def handle(self, *args, **options):
+        sizes = Sizes(**{
+            field: options[field] for field in Sizes.__dataclass_fields__})
+        rand = random.Random(options['seed'])
+        results = {
+            'vendor': connection.vendor,
+            'seed': options['seed'],
+            'sizes': vars(sizes),
+        }
+        # Загруженные картинки пишутся во временную папку, а не в MEDIA_ROOT
+        with tempfile.TemporaryDirectory(prefix='benchmark-') as media:
+            with override_settings(MEDIA_ROOT=media):
+                results['scenarios'] = self.run_scenarios(
+                    sizes, rand, options['scenario'], options['iterations'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+            regressions = compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError(
+                    'Регрессия относительно baseline:\n'
+                    + '\n'.join(regressions))
+            self.stdout.write('Регрессий относительно baseline нет')
+
+    @transaction.atomic
+    def run_scenarios(self, sizes, rand, selected, iterations):
+        start = time.monotonic()
+        data = seed_dataset(sizes, rand, f'b{uuid.uuid4().hex[:8]}_')
+        data.update(image=make_image(), created=[])
+        self.stdout.write(
+            f'Данные созданы за {time.monotonic() - start:.1f} с')
+        results = {}
+        for scenario in SCENARIOS:
+            if selected and scenario.name not in selected:
+                continue
+            if scenario.name == 'recipe_update' and not data['created']:
+                data['created'] = [
+                    (recipe.pk, recipe.author) for recipe in
+                    Recipe.objects.filter(
+                        pk__in=data['recipes'][:ITERATIONS]
+                    ).select_related('author')
+                ]
+            result = run_scenario(scenario, data, rand, iterations)
+            results[scenario.name] = result
+            self.stdout.write(
+                f'{scenario.name}: p50 {result["p50_ms"]} мс, '
+                f'p95 {result["p95_ms"]} мс, '
+                f'запросов до {result["queries_max"]}'
+            )
+        transaction.set_rollback(True)
+        return results
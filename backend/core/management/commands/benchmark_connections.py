@@ -0,0 +1,91 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIClient
+
+from core.benchmark import PERCENTILES, percentile
+from users.models import User
+
+ITERATIONS = 200
+URLS = ('/api/recipes/?limit=6', '/api/users/me/')
+
+
+def per_request():
+    """Что делает CONN_MAX_AGE=0 в конце каждого запроса"""
+    connection.close()
+
+
+def persistent():
+    pass
+
+
+# (режим, что делается после запроса); проверка соединения в начале
+# запроса включена, если она включена в настройках
+MODES = (
+    ('per_request', per_request),
+    ('persistent', persistent),
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержку запросов к API с новым соединением к БД '
+            'на каждый запрос и с постоянным соединением. Данные не '
+            'меняются: нужен хотя бы один пользователь.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=ITERATIONS)
+        parser.add_argument(
+            '--url', action='append',
+            help=f'Запрашиваемые адреса, по умолчанию {", ".join(URLS)}'
+        )
+        parser.add_argument('--output', help='Куда записать результаты JSON')
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('В базе нет пользователей')
+        client = APIClient()
+        client.force_authenticate(user)
+        urls = options['url'] or URLS
+        results = {
+            'vendor': connection.vendor,
+            'urls': urls,
+            'health_checks': settings.DB_CONN_HEALTH_CHECKS,
+            'modes': {},
+        }
+        for name, after_request in MODES:
+            result = self.run_mode(
+                client, urls, after_request, options['iterations'])
+            results['modes'][name] = result
+            self.stdout.write(
+                f'{name}: p50 {result["p50_ms"]} мс, '
+                f'p95 {result["p95_ms"]} мс'
+            )
+        saved = (results['modes']['per_request']['p50_ms']
+                 - results['modes']['persistent']['p50_ms'])
+        results['connection_setup_ms'] = round(saved, 3)
+        self.stdout.write(f'Установка соединения: ~{saved:.3f} мс на запрос')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+
+    def run_mode(self, client, urls, after_request, iterations):
+        """Первый прогон прогревает кеши и в статистику не попадает"""
+        timings = []
+        for iteration in range(iterations + 1):
+            url = urls[iteration % len(urls)]
+            start = time.perf_counter()
+            response = client.get(url)
+            elapsed = (time.perf_counter() - start) * 1000
+            after_request()
+            if response.status_code >= 400:
+                raise CommandError(f'{url}: ответ {response.status_code}')
+            if iteration:
+                timings.append(elapsed)
+        return {
+            f'p{percent}_ms': round(percentile(timings, percent), 3)
+            for percent in PERCENTILES
+        }
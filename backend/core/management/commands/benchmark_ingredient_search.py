@@ -0,0 +1,75 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.autocomplete import search_ingredients
+from api.reference_cache import bump_version
+from recipes.models import Ingredient
+
+SIZE = 100_000
+QUERIES = 500
+BATCH_SIZE = 5000
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.')
+
+
+class Command(BaseCommand):
+    help = ('Замеряет автодополнение ингредиентов на синтетическом '
+            'каталоге. Данные создаются в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=SIZE)
+        parser.add_argument('--queries', type=int, default=QUERIES)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rand = random.Random(options['seed'])
+        with transaction.atomic():
+            words = self.seed_catalogue(options['size'], rand)
+            bump_version(Ingredient)
+            timings = self.run_queries(words, options['queries'], rand)
+            transaction.set_rollback(True)
+        bump_version(Ingredient)
+        timings.sort()
+        self.stdout.write(
+            f'Ингредиентов: {options["size"]}, запросов: {len(timings)}\n'
+            f'p50: {statistics.median(timings):.2f} мс, '
+            f'p95: {timings[int(len(timings) * 0.95)]:.2f} мс, '
+            f'max: {timings[-1]:.2f} мс'
+        )
+
+    def seed_catalogue(self, size, rand):
+        words = list(
+            Ingredient.objects.values_list('name', flat=True)[:1000]
+        ) or ['абрикос', 'баклажан', 'ваниль', 'горох', 'дыня']
+        start = time.monotonic()
+        for offset in range(0, size, BATCH_SIZE):
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(
+                        name=f'{rand.choice(words)} {number}',
+                        measurement_unit=rand.choice(UNITS)
+                    )
+                    for number in range(offset, min(offset + BATCH_SIZE,
+                                                    size))
+                ],
+                ignore_conflicts=True
+            )
+        self.stdout.write(
+            f'Каталог создан за {time.monotonic() - start:.1f} с')
+        return words
+
+    def run_queries(self, words, count, rand):
+        # Первый запрос строит индекс в памяти для не-PostgreSQL баз,
+        # поэтому в статистику он не попадает.
+        list(search_ingredients(Ingredient.objects.all(), 'а'))
+        timings = []
+        for _ in range(count):
+            word = rand.choice(words)
+            value = word[:rand.randint(1, min(len(word), 5))]
+            start = time.perf_counter()
+            list(search_ingredients(Ingredient.objects.all(), value))
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
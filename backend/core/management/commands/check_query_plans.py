@@ -0,0 +1,145 @@
+import json
+import random
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.autocomplete import search_ingredients
+from api.shopping_cart import get_ingredients_queryset
+from core.benchmark import Sizes, seed_dataset
+from recipes.feed import backfill
+from recipes.models import (Favourite, FeedEntry, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingList)
+from users.models import Subscribtions, User
+
+# Размеры по умолчанию: планировщик PostgreSQL выбирает индексы, только
+# когда таблицы заметно больше пары страниц
+SIZES = Sizes(users=2000, recipes=20000, ingredients=5000)
+MIN_ROWS = 1000
+MODELS = (Recipe, Ingredient, IngredientInRecipe, Favourite, ShoppingList,
+          Subscribtions, User, FeedEntry, Recipe.tags.through)
+# (имя, функция data -> QuerySet)
+QUERIES = (
+    ('recipes_newest', lambda data: Recipe.objects.order_by(
+        '-created', '-id')[:6]),
+    ('recipes_popular', lambda data: Recipe.objects.order_by(
+        '-favorites_count', '-id')[:6]),
+    ('recipes_by_author', lambda data: Recipe.objects.filter(
+        author=data['user']).order_by('-created', '-id')[:6]),
+    ('recipes_by_tag', lambda data: Recipe.objects.filter(
+        tags=data['tags'][0]).order_by('-created', '-id')[:6]),
+    ('recipe_is_favorited', lambda data: Favourite.objects.filter(
+        user=data['user'], recipe_id=data['recipe'])),
+    ('recipe_in_cart', lambda data: ShoppingList.objects.filter(
+        user=data['user'], recipe_id=data['recipe'])),
+    ('recipe_favorites_count', lambda data: Favourite.objects.filter(
+        recipe_id=data['recipe']).values('recipe')),
+    ('shopping_cart', lambda data: get_ingredients_queryset(data['user'])),
+    ('subscriptions', lambda data: User.objects.filter(
+        following__user=data['user']).order_by('pk')[:6]),
+    ('subscription_recipes', lambda data: Recipe.objects.limited_per_author(
+        3).filter(author_id__in=data['authors']).order_by('-pk')),
+    ('is_subscribed', lambda data: User.objects.with_is_subscribed(
+        data['user']).filter(pk__in=data['authors'])),
+    ('followers', lambda data: Subscribtions.objects.filter(
+        author=data['user']).values_list('user_id', flat=True)),
+    # Триграммный индекс работает с трёх символов
+    ('ingredient_autocomplete', lambda data: search_ingredients(
+        Ingredient.objects.all(), 'бав')[:20]),
+    ('feed', lambda data: FeedEntry.objects.filter(
+        user=data['user']).order_by('-created', '-recipe_id')[:20]),
+)
+
+
+def find_sequential_scans(plan):
+    """Таблицы, которые план читает целиком"""
+    if connection.vendor == 'postgresql':
+        return set(postgresql_scans(json.loads(plan)[0]['Plan']))
+    tables = set()
+    for line in plan.splitlines():
+        detail = line.split(None, 3)[-1]
+        if detail.startswith('SCAN ') and 'USING' not in detail:
+            tables.add(detail.split()[1])
+    return tables
+
+
+def postgresql_scans(node):
+    if node['Node Type'] == 'Seq Scan':
+        yield node['Relation Name']
+    for child in node.get('Plans', ()):
+        yield from postgresql_scans(child)
+
+
+class Command(BaseCommand):
+    help = ('Проверяет EXPLAIN основных запросов API на синтетических '
+            'данных (откатываются) и падает, если запрос читает большую '
+            'таблицу последовательным сканированием.')
+
+    def add_arguments(self, parser):
+        for field in Sizes.__dataclass_fields__:
+            parser.add_argument(
+                f'--{field.replace("_", "-")}', type=int,
+                default=getattr(SIZES, field)
+            )
+        parser.add_argument('--min-rows', type=int, default=MIN_ROWS)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать планы всех запросов'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError('Поддерживаются PostgreSQL и SQLite')
+        sizes = Sizes(**{
+            field: options[field] for field in Sizes.__dataclass_fields__})
+        rand = random.Random(options['seed'])
+        with transaction.atomic():
+            data = self.prepare(sizes, rand)
+            rows = {
+                model._meta.db_table: model.objects.count()
+                for model in MODELS
+            }
+            failures = self.check_queries(
+                data, rows, options['min_rows'], options['verbose_plans'])
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(
+                'Последовательное сканирование больших таблиц:\n'
+                + '\n'.join(failures))
+        self.stdout.write('Все запросы используют индексы')
+
+    def prepare(self, sizes, rand):
+        data = seed_dataset(sizes, rand, f'p{uuid.uuid4().hex[:8]}_')
+        for subscription in Subscribtions.objects.filter(
+                user__in=data['users']).select_related('author'):
+            backfill(subscription.user_id, subscription.author)
+        user = data['users'][0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return {
+            'user': user,
+            'tags': data['tags'],
+            'recipe': data['recipes'][0],
+            'authors': list(Subscribtions.objects.filter(
+                user=user).values_list('author_id', flat=True)),
+        }
+
+    def check_queries(self, data, rows, min_rows, verbose):
+        explain_options = (
+            {'format': 'json'} if connection.vendor == 'postgresql' else {})
+        failures = []
+        for name, build in QUERIES:
+            plan = build(data).explain(**explain_options)
+            if verbose:
+                self.stdout.write(f'{name}:\n{plan}\n')
+            scans = sorted(
+                table for table in find_sequential_scans(plan)
+                if rows.get(table, 0) >= min_rows
+            )
+            if scans:
+                failures.append(f'{name}: {", ".join(scans)}')
+            else:
+                self.stdout.write(f'{name}: OK')
+        return failures
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.reference_cache import bump_version
+from recipes.models import RecipeTrend
+from recipes.trending import rebuild_trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг популярных рецептов. '
+            'Запускается периодически, например из cron.')
+
+    def handle(self, *args, **options):
+        count = rebuild_trending()
+        bump_version(RecipeTrend)
+        self.stdout.write(f'Рецептов в рейтинге: {count}')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.cookable import rebuild_postings
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает обратный индекс «ингредиент - рецепты» для '
+            'поиска по имеющимся продуктам.')
+
+    def handle(self, *args, **options):
+        count = rebuild_postings()
+        self.stdout.write(f'Записей в индексе: {count}')
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from api.reference_cache import bump_version
+from recipes.counters import actual_count
+from recipes.models import Favourite, IngredientInRecipe, Recipe, ShoppingList
+from users.models import Subscribtions, User
+
+BATCH_SIZE = 1000
+
+# (модель, поле счётчика, модель связи, поле связи)
+COUNTERS = (
+    (Recipe, 'ingredients_count', IngredientInRecipe, 'recipe'),
+    (Recipe, 'favorites_count', Favourite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscribtions, 'author'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает разошедшиеся денормализованные счётчики.'
+
+    def handle(self, *args, **options):
+        for model, field, related_model, related_field in COUNTERS:
+            actual = actual_count(related_model, related_field)
+            drifted = list(
+                model.objects.annotate(actual=actual).exclude(
+                    **{field: F('actual')}
+                ).values_list('pk', flat=True)
+            )
+            for start in range(0, len(drifted), BATCH_SIZE):
+                model.objects.filter(
+                    pk__in=drifted[start:start + BATCH_SIZE]
+                ).update(**{field: actual})
+            if field == 'favorites_count' and drifted:
+                # Порядок popular в кеше анонимов
+                bump_version(Favourite)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}.{field}: '
+                f'исправлено {len(drifted)}'
+            )
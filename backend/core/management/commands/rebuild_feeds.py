@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import backfill
+from recipes.models import FeedEntry
+from users.models import Subscribtions
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает ленты подписок: по FEED_BACKFILL_SIZE последних '
+            'рецептов каждого автора, на которого подписан пользователь.')
+
+    def handle(self, *args, **options):
+        subscriptions = Subscribtions.objects.select_related('author')
+        with transaction.atomic():
+            FeedEntry.objects.all().delete()
+            for subscription in subscriptions.iterator():
+                backfill(subscription.user_id, subscription.author)
+        self.stdout.write(
+            f'Записей в лентах: {FeedEntry.objects.count()}')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+
+from recipes.models import Recipe
+from recipes.search import ensure_search_index, index_recipes
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс рецептов пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        ensure_search_index(connections[router.db_for_write(Recipe)])
+        batch_size = options['batch_size']
+        ids = Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        total = 0
+        last = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last)[:batch_size])
+            if not batch:
+                break
+            index_recipes(batch)
+            total += len(batch)
+            last = batch[-1]
+            self.stdout.write(f'Проиндексировано рецептов: {total}')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.feed import trim_feeds
+
+
+class Command(BaseCommand):
+    help = ('Оставляет в каждой ленте подписок FEED_MAX_ENTRIES новых '
+            'записей. Запускается по расписанию.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Обрезано лент: {trim_feeds()}')
@@ -0,0 +1,176 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from threading import Lock
+
+# Границы гистограммы длительности запроса, секунды
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# (имя метрики, поле RequestStats, описание)
+SUMMARIES = (
+    ('queries', 'queries', 'SQL-запросов за запрос'),
+    ('db_seconds', 'db_time', 'Время в БД, секунды'),
+    ('python_seconds', 'python_time',
+     'Время во вьюхе без БД и сериализации, секунды'),
+    ('serialize_seconds', 'serialize_time',
+     'Время в serializer.data без БД, секунды'),
+    ('render_seconds', 'render_time', 'Время рендеринга ответа, секунды'),
+)
+
+
+class QueryRecorder:
+    """
+    Обёртка execute для connection.execute_wrapper: считает запросы и
+    время в БД, а первые max_queries запросов запоминает с длительностью.
+    """
+
+    def __init__(self, max_queries):
+        self.max_queries = max_queries
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if len(self.queries) < self.max_queries:
+                self.queries.append((round(duration * 1000, 3), sql))
+
+
+class SerializerMetricsMixin:
+    """Вьюха засекает время serializer.data у своих get_serializer"""
+
+    def get_serializer(self, *args, **kwargs):
+        return timed_serializer(
+            super().get_serializer(*args, **kwargs), self.request)
+
+
+def timed_serializer(serializer, request):
+    """
+    Время serializer.data добавляется к serialize_time запроса, который
+    размечает RequestMetricsMiddleware. SQL-запросы ленивых QuerySet
+    внутри сериализации считаются и в db_time, поэтому при подсчёте
+    вычитаются.
+    """
+    request = getattr(request, '_request', request)
+    if not hasattr(request, 'serialize_time'):
+        return serializer
+    serializer.__class__ = timed_class(type(serializer))
+    serializer.metrics_request = request
+    return serializer
+
+
+@lru_cache(maxsize=None)
+def timed_class(cls):
+    class Timed(cls):
+        @property
+        def data(self):
+            request = self.metrics_request
+            recorder = request.query_recorder
+            db_time = recorder.duration
+            start = time.perf_counter()
+            try:
+                return super().data
+            finally:
+                request.serialize_time += max(
+                    time.perf_counter() - start
+                    - (recorder.duration - db_time), 0)
+
+    Timed.__name__ = cls.__name__
+    Timed.__qualname__ = cls.__qualname__
+    Timed.__module__ = cls.__module__
+    return Timed
+
+
+class RequestStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.python_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+class MetricsRegistry:
+    """Накопленные метрики по вьюхам в памяти процесса"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.stats = defaultdict(RequestStats)
+
+    def observe(self, view, method, status, queries, db_time, serialize_time,
+                render_time, total_time):
+        with self.lock:
+            stats = self.stats[(view, method, status)]
+            stats.requests += 1
+            stats.queries += queries
+            stats.db_time += db_time
+            stats.serialize_time += serialize_time
+            stats.render_time += render_time
+            stats.python_time += max(
+                total_time - db_time - serialize_time - render_time, 0)
+            stats.total_time += total_time
+            stats.buckets[bisect_left(LATENCY_BUCKETS, total_time)] += 1
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        with self.lock:
+            items = sorted(self.stats.items())
+            lines = [
+                '# HELP foodgram_requests_total Обработано запросов',
+                '# TYPE foodgram_requests_total counter',
+            ]
+            lines.extend(
+                f'foodgram_requests_total{{{labels(key)}}} {stats.requests}'
+                for key, stats in items
+            )
+            for name, field, description in SUMMARIES:
+                lines.append(f'# HELP foodgram_request_{name} {description}')
+                lines.append(f'# TYPE foodgram_request_{name} summary')
+                for key, stats in items:
+                    lines.append(
+                        f'foodgram_request_{name}_sum{{{labels(key)}}} '
+                        f'{getattr(stats, field)}'
+                    )
+                    lines.append(
+                        f'foodgram_request_{name}_count{{{labels(key)}}} '
+                        f'{stats.requests}'
+                    )
+            lines.append('# HELP foodgram_request_duration_seconds '
+                         'Длительность запроса')
+            lines.append('# TYPE foodgram_request_duration_seconds histogram')
+            for key, stats in items:
+                total = 0
+                for bound, count in zip(
+                        LATENCY_BUCKETS + ('+Inf', ), stats.buckets):
+                    total += count
+                    lines.append(
+                        'foodgram_request_duration_seconds_bucket'
+                        f'{{{labels(key)},le="{bound}"}} {total}'
+                    )
+                lines.append(
+                    f'foodgram_request_duration_seconds_sum{{{labels(key)}}} '
+                    f'{stats.total_time}'
+                )
+                lines.append(
+                    'foodgram_request_duration_seconds_count'
+                    f'{{{labels(key)}}} {stats.requests}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def labels(key):
+    view, method, status = key
+    view = view.replace('\\', '\\\\').replace('"', '\\"')
+    return f'view="{view}",method="{method}",status="{status}"'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import QueryRecorder, registry
+from .routers import pin_after_write, read_database
+
+logger = logging.getLogger('foodgram.requests')
+STICKY_KEY = 'db_primary:{}'
+
+
+class RequestMetricsMiddleware:
+    """
+    Считает для каждого запроса SQL-запросы, время в БД, время
+    serializer.data (SerializerMetricsMixin), время рендеринга ответа и
+    общую длительность. Пишет их в реестр метрик (/metrics/) и в лог
+    одной JSON-строкой; для запросов дольше SLOW_REQUEST_THRESHOLD_MS в
+    лог попадают и их SQL-запросы. Потоковые ответы учитываются, когда
+    отдан последний кусок.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        recorder = QueryRecorder(settings.SLOW_REQUEST_MAX_QUERIES)
+        request.query_recorder = recorder
+        request.serialize_time = 0.0
+        request.render_time = 0.0
+        start = time.perf_counter()
+        with record_queries(recorder):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, response.streaming_content, start)
+            return response
+        self.finish(request, response, start)
+        return response
+
+    def stream(self, request, response, content, start):
+        """Запросы, которые делает итератор ответа, тоже записываются"""
+        try:
+            with record_queries(request.query_recorder):
+                yield from content
+        finally:
+            self.finish(request, response, start)
+
+    def finish(self, request, response, start):
+        total_time = time.perf_counter() - start
+        recorder = request.query_recorder
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        registry.observe(
+            view, request.method, response.status_code, recorder.count,
+            recorder.duration, request.serialize_time, request.render_time,
+            total_time
+        )
+        self.log(request, response, view, recorder, total_time)
+
+    def process_template_response(self, request, response):
+        """Ответы DRF рендерятся после вьюхи: засекаем это время отдельно"""
+        if not hasattr(request, 'render_time'):
+            return response
+        start = time.perf_counter()
+
+        def rendered(response):
+            request.render_time += time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def log(request, response, view, recorder, total_time):
+        slow = total_time * 1000 >= settings.SLOW_REQUEST_THRESHOLD_MS
+        record = {
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 3),
+            'serialize_ms': round(request.serialize_time * 1000, 3),
+            'render_ms': round(request.render_time * 1000, 3),
+            'total_ms': round(total_time * 1000, 3),
+            'slow': slow,
+        }
+        if slow:
+            record['sql'] = recorder.queries
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False))
+
+
+@contextmanager
+def record_queries(recorder):
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Безопасные запросы читают со случайной реплики из READ_REPLICAS.
+    Пользователь, который только что писал, ещё DB_PRIMARY_STICKY_SECONDS
+    читает из основной базы, чтобы видеть свои изменения до того, как их
+    получит реплика. Пользователь определяется по заголовку Authorization,
+    поэтому для нескольких воркеров нужен общий кеш.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.READ_REPLICAS:
+            return self.get_response(request)
+        key = self.get_sticky_key(request)
+        replica = None
+        if request.method in SAFE_METHODS and not (key and cache.get(key)):
+            replica = random.choice(settings.READ_REPLICAS)
+        token = read_database.set(replica)
+        try:
+            with connections[DEFAULT_DB_ALIAS].execute_wrapper(
+                    pin_after_write):
+                response = self.get_response(request)
+            wrote = (
+                request.method not in SAFE_METHODS
+                or replica is not None and read_database.get() is None
+            )
+        finally:
+            read_database.reset(token)
+        if key and wrote:
+            cache.set(key, True, settings.DB_PRIMARY_STICKY_SECONDS)
+        return response
+
+    @staticmethod
+    def get_sticky_key(request):
+        credentials = request.META.get('HTTP_AUTHORIZATION')
+        if not credentials:
+            return None
+        return STICKY_KEY.format(
+            hashlib.sha256(credentials.encode()).hexdigest())
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+TABLE = 'recipes_recipe'
+INDEX_NAME = 'recipe_search_vector_idx'
+
+
+def create_index(apps, schema_editor):
+    """Колонка search_vector появляется в миграции recipes"""
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        columns = [
+            column.name for column in
+            connection.introspection.get_table_description(cursor, TABLE)
+        ]
+    if 'search_vector' in columns:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+            f'ON {TABLE} USING gin (search_vector)'
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+    """GIN-индекс полнотекстового поиска рецептов (только PostgreSQL)"""
+
+    dependencies = [
+        ('core', '0001_ingredient_search_indexes'),
+        ('recipes', '0011_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
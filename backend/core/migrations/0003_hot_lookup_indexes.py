@@ -0,0 +1,61 @@
+from django.db import migrations
+
+# (имя, таблица, определение); создаются CONCURRENTLY, без блокировки записи
+INDEXES = (
+    # Рецепты автора по дате: фильтр author, лента подписок, backfill
+    ('recipe_author_created_idx', 'recipes_recipe',
+     '(author_id, created DESC, id DESC)'),
+    # Последние рецепты автора в подписках (limited_per_author)
+    ('recipe_author_id_idx', 'recipes_recipe', '(author_id, id DESC)'),
+    # Рецепты без уменьшенных копий (generate_image_variants --missing)
+    ('recipe_pending_variants_idx', 'recipes_recipe',
+     "(id) WHERE image_variants = '{}'::jsonb"),
+    # Сумма ингредиентов корзины только по индексу
+    ('ingredient_in_recipe_cover_idx', 'recipes_ingredientinrecipe',
+     '(recipe_id) INCLUDE (ingredient_id, amount)'),
+    # Подписчики автора для fan-out и счётчиков только по индексу
+    ('subscription_author_cover_idx', 'users_subscribtions',
+     '(author_id) INCLUDE (user_id)'),
+    # Избранное и корзина по рецепту (счётчики, сброс корзин): уникальные
+    # ограничения начинаются с user и здесь не помогают
+    ('favourite_recipe_user_idx', 'recipes_favourite',
+     '(recipe_id, user_id)'),
+    ('shopping_list_recipe_user_idx', 'recipes_shoppinglist',
+     '(recipe_id, user_id)'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, definition in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+            f'ON {table} {definition}'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    """
+    Индексы под горячие выборки API (только PostgreSQL). CONCURRENTLY
+    нельзя выполнять в транзакции, поэтому миграция не атомарная.
+    """
+    atomic = False
+
+    dependencies = [
+        ('core', '0002_recipe_search_index'),
+        # Колонки created и image_variants появляются здесь
+        ('recipes', '0007_recipe_image_variants'),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,59 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Реплика, с которой читает текущий запрос; None - всё идёт в основную
+# базу. Вне запросов (команды, потоки обработки картинок) всегда None.
+read_database = ContextVar('read_database', default=None)
+# Токены проверяются сразу после входа, до того как реплика догонит базу
+PRIMARY_MODELS = {'authtoken.token'}
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+@contextmanager
+def use_primary():
+    """Чтения внутри блока идут в основную базу"""
+    token = read_database.set(None)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+def pin_after_write(execute, sql, params, many, context):
+    """
+    Обёртка запросов основной базы: первая запись переключает остаток
+    запроса на основную базу, чтобы он видел свои изменения.
+    db_for_write для этого не годится - Django зовёт его и при простом
+    присваивании связанного объекта.
+    """
+    if sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+        read_database.set(None)
+    return execute(sql, params, many, context)
+
+
+class ReplicaRouter:
+    """
+    Читает с реплики, выбранной ReplicaRoutingMiddleware; пишет в основную
+    базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in PRIMARY_MODELS:
+            return DEFAULT_DB_ALIAS
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.READ_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Реплики получают схему репликацией"""
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,210 @@
+import os
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.reference_cache import responses
+from recipes.models import Tag
+from users.models import User
+from .backends.postgresql.base import DatabaseWrapper
+from .checks import check_connection_budget
+from .metrics import registry
+from .middleware import ReplicaRoutingMiddleware, RequestMetricsMiddleware
+
+
+class RequestMetricsTest(TestCase):
+    """Метрики запросов: сериализация, потоковые ответы, выключение"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(
+            name='завтрак', color='#E26C2D', slug='breakfast')
+
+    def setUp(self):
+        cache.clear()
+        registry.stats.clear()
+
+    def test_serialization_is_timed(self):
+        response = APIClient().get(f'/api/tags/{self.tag.pk}/')
+        self.assertEqual(response.status_code, 200)
+        stats = registry.stats[('api:tags-detail', 'GET', 200)]
+        self.assertEqual(stats.requests, 1)
+        self.assertGreater(stats.serialize_time, 0)
+        self.assertIn('foodgram_request_serialize_seconds_sum',
+                      registry.render())
+
+    def test_streaming_queries_are_recorded(self):
+        def content():
+            yield str(Tag.objects.count())
+
+        request = RequestFactory().get('/stream/')
+        request.resolver_match = None
+        middleware = RequestMetricsMiddleware(
+            lambda request: StreamingHttpResponse(content()))
+        response = middleware(request)
+        self.assertNotIn(('unresolved', 'GET', 200), registry.stats)
+        self.assertEqual(b''.join(response.streaming_content), b'1')
+        stats = registry.stats[('unresolved', 'GET', 200)]
+        self.assertEqual(stats.queries, 1)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        response = APIClient().get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(registry.stats)
+
+
+@override_settings(READ_REPLICAS=['replica_0'], DB_PRIMARY_STICKY_SECONDS=0.2)
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    Чтения с реплики на двух базах SQLite. В реплике есть только таблица
+    тегов с другим названием тега, поэтому по ответу видно, откуда он.
+    """
+
+    databases = {'default', 'replica_0'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with connections['replica_0'].schema_editor() as editor:
+            editor.create_model(Tag)
+
+    @classmethod
+    def tearDownClass(cls):
+        with connections['replica_0'].schema_editor() as editor:
+            editor.delete_model(Tag)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.tag = Tag.objects.create(
+            name='основная', color='#E26C2D', slug='breakfast')
+        Tag.objects.using('replica_0').create(
+            pk=self.tag.pk, name='реплика', color='#E26C2D', slug='breakfast')
+        self.user = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='x')
+        self.token = Token.objects.create(user=self.user)
+        self.factory = RequestFactory(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        cache.clear()
+        responses.clear()
+
+    def tearDown(self):
+        # Таблиц связей в реплике нет, поэтому без каскада delete()
+        with connections['replica_0'].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {Tag._meta.db_table}')
+
+    def read_tag(self, request):
+        return HttpResponse(Tag.objects.get(pk=self.tag.pk).name)
+
+    def write_tag(self, request):
+        Tag.objects.filter(pk=self.tag.pk).update(color='#000000')
+        return HttpResponse()
+
+    def call(self, view, method='get'):
+        request = getattr(self.factory, method)('/')
+        return ReplicaRoutingMiddleware(view)(request).content.decode()
+
+    def test_safe_methods_read_replica(self):
+        self.assertEqual(self.call(self.read_tag), 'реплика')
+        self.assertEqual(self.call(self.read_tag, 'post'), 'основная')
+
+    def test_sticky_window(self):
+        self.call(self.write_tag, 'post')
+        self.assertEqual(self.call(self.read_tag), 'основная')
+        time.sleep(0.3)
+        self.assertEqual(self.call(self.read_tag), 'реплика')
+
+    def test_write_pins_rest_of_request(self):
+        def view(request):
+            names = [Tag.objects.get(pk=self.tag.pk).name]
+            Tag.objects.filter(pk=self.tag.pk).update(name='новая')
+            names.append(Tag.objects.get(pk=self.tag.pk).name)
+            return HttpResponse(' '.join(names))
+
+        self.assertEqual(self.call(view), 'реплика новая')
+        self.assertEqual(self.call(self.read_tag), 'новая')
+
+    def test_tokens_read_primary(self):
+        def view(request):
+            token = Token.objects.select_related('user').get(
+                key=self.token.key)
+            return HttpResponse(token.user.username)
+
+        self.assertEqual(self.call(view), 'cook')
+
+    def test_anonymous_cache_miss(self):
+        client = APIClient()
+        response = client.get(f'/api/tags/{self.tag.pk}/')
+        self.assertEqual(response.json()['name'], 'реплика')
+        self.tag.name = 'новая'
+        self.tag.save()
+        response = client.get(f'/api/tags/{self.tag.pk}/')
+        self.assertEqual(response.json()['name'], 'новая')
+
+
+class ConnectionHealthCheckTest(SimpleTestCase):
+    """Постоянное соединение проверяется лениво, один раз за запрос"""
+
+    def setUp(self):
+        self.wrapper = DatabaseWrapper({
+            **connections['default'].settings_dict,
+            'ENGINE': 'core.backends.postgresql',
+        }, alias='health')
+        self.wrapper.connection = mock.Mock()
+        self.connect = mock.patch.object(self.wrapper, 'connect').start()
+        self.close = mock.patch.object(
+            self.wrapper, 'close',
+            side_effect=lambda: setattr(self.wrapper, 'connection', None)
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_checked_once_on_first_use(self):
+        with mock.patch.object(self.wrapper, 'is_usable',
+                               return_value=True) as is_usable:
+            self.wrapper.ensure_connection()
+            self.assertFalse(is_usable.called)
+            self.wrapper.health_check_done = False
+            self.wrapper.ensure_connection()
+            self.wrapper.ensure_connection()
+        is_usable.assert_called_once_with()
+        self.assertFalse(self.close.called)
+        self.assertFalse(self.connect.called)
+
+    def test_unusable_connection_is_reopened(self):
+        self.wrapper.health_check_done = False
+        with mock.patch.object(self.wrapper, 'is_usable', return_value=False):
+            self.wrapper.ensure_connection()
+        self.close.assert_called_once_with()
+        self.connect.assert_called_once_with()
+
+    def test_request_resets_flag(self):
+        connection = connections['default']
+        connection.health_check_done = True
+        request_started.send(sender=self.__class__)
+        self.assertFalse(connection.health_check_done)
+
+
+class ConnectionBudgetCheckTest(SimpleTestCase):
+    """core.W001: постоянные соединения воркеров и max_connections"""
+
+    def check(self, workers):
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': str(workers)}):
+            return [error.id for error in check_connection_budget(None)]
+
+    @override_settings(DB_CONNECTION_MODE='persistent', DB_MAX_CONNECTIONS=20,
+                       IMAGE_PIPELINE_WORKERS=1)
+    def test_persistent(self):
+        self.assertEqual(self.check(4), [])
+        self.assertEqual(self.check(10), ['core.W001'])
+
+    @override_settings(DB_CONNECTION_MODE='pgbouncer', DB_MAX_CONNECTIONS=20)
+    def test_pgbouncer(self):
+        self.assertEqual(self.check(100), [])
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+from .metrics import registry
+
+
+def metrics(request):
+    """Метрики процесса для Prometheus, только для доверенных адресов"""
+    if (
+        not settings.METRICS_ENABLED
+        or request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS
+    ):
+        raise Http404
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4')
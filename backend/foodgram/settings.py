@@ -32,6 +32,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,6 +63,28 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+# Режим соединений с БД:
+# per_request - новое соединение на каждый запрос;
+# persistent - соединение воркера живёт DB_CONN_MAX_AGE секунд и
+# проверяется при первом обращении в запросе (core.backends.postgresql);
+# pgbouncer - то же, но DB_HOST указывает на pgbouncer в режиме
+# transaction, который держит DB_POOL_SIZE соединений к postgres на все
+# воркеры; серверные курсоры (iterator()) в этом режиме невозможны.
+DB_CONNECTION_MODE = os.getenv('DB_CONNECTION_MODE', default='persistent')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', default=600))
+DB_CONNECTION_MODES = {
+    'per_request': {'CONN_MAX_AGE': 0},
+    'persistent': {'CONN_MAX_AGE': DB_CONN_MAX_AGE},
+    'pgbouncer': {
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'DISABLE_SERVER_SIDE_CURSORS': True,
+    },
+}
+DB_CONN_HEALTH_CHECKS = DB_CONNECTION_MODE != 'per_request'
+# max_connections postgres: с ним сверяется число постоянных соединений
+# воркеров gunicorn (WEB_CONCURRENCY) и потоков обработки картинок
+DB_MAX_CONNECTIONS = int(os.getenv('DB_MAX_CONNECTIONS', default=100))
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
@@ -68,9 +92,37 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        **DB_CONNECTION_MODES[DB_CONNECTION_MODE],
     }
 }
+# В Django 3.2 нет CONN_HEALTH_CHECKS: обёртка над PostgreSQL проверяет
+# постоянное соединение при первом обращении в запросе
+if (DB_CONN_HEALTH_CHECKS
+        and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'):
+    DATABASES['default']['ENGINE'] = 'core.backends.postgresql'
+
+# Реплики для чтения через запятую: host или host:port, для SQLite - пути
+# к файлам. GET-запросы читают с них, а пользователь, который писал в
+# последние DB_PRIMARY_STICKY_SECONDS, - из основной базы.
+DB_REPLICAS = [
+    replica for replica in os.getenv('DB_REPLICAS', default='').split(',')
+    if replica
+]
+DB_PRIMARY_STICKY_SECONDS = int(
+    os.getenv('DB_PRIMARY_STICKY_SECONDS', default=10))
+READ_REPLICAS = []
+for number, replica in enumerate(DB_REPLICAS):
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        location = {'NAME': replica}
+    else:
+        host, _, port = replica.partition(':')
+        location = {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'], **location, 'TEST': {'MIRROR': 'default'}}
+    READ_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
 
 # Для локальной проверки по апи
 # DATABASES = {
@@ -104,7 +156,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
@@ -138,3 +190,84 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Общий кеш: locmem по умолчанию, но он годится только для одного
+# процесса - версии кешей и сброс токенов в нём не видны другим воркерам.
+# При WEB_CONCURRENCY > 1 нужен файловый или Redis-совместимый бэкенд,
+# например CACHE_BACKEND=django_redis.cache.RedisCache (проверка core.W003)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+# Пользователи по токену: LRU воркера с коротким TTL (столько другие
+# воркеры принимают токен после выхода) и общий кеш, который сбрасывается
+# сигналами сразу
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=1024))
+TOKEN_CACHE_LOCAL_TIMEOUT = int(
+    os.getenv('TOKEN_CACHE_LOCAL_TIMEOUT', default=5))
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=60 * 10))
+# Ответы ленты рецептов для анонимов; сигналы сбрасывают их раньше
+RECIPE_FEED_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_FEED_CACHE_TIMEOUT', default=60))
+
+# Список покупок кешируется до изменения корзины или рецептов в ней
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Загрузка изображений рецептов и их уменьшенные копии
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_DIMENSION = 4096
+RECIPE_IMAGE_VARIANTS = {
+    'small': 320,
+    'medium': 640,
+}
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', default=2))
+IMAGE_PIPELINE_EAGER = os.getenv('IMAGE_PIPELINE_EAGER') == 'True'
+
+# Рейтинг популярных рецептов (команда compute_trending)
+TRENDING_WINDOW_DAYS = 7
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_FAVORITE_WEIGHT = 1.0
+TRENDING_CART_WEIGHT = 0.5
+
+# Лента подписок: рецепты авторов с большим числом подписчиков не
+# раскладываются по лентам, а подмешиваются при чтении
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', default=10000))
+FEED_BACKFILL_SIZE = 100
+# Глубина ленты: лишнее убирает команда trim_feeds
+FEED_MAX_ENTRIES = int(os.getenv('FEED_MAX_ENTRIES', default=1000))
+FEED_CELEBRITIES_CACHE_TIMEOUT = 60 * 5
+
+# Метрики запросов (/metrics/) и лог медленных запросов
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='True') == 'True'
+METRICS_ALLOWED_IPS = os.getenv(
+    'METRICS_ALLOWED_IPS', default='127.0.0.1').split(',')
+SLOW_REQUEST_THRESHOLD_MS = int(
+    os.getenv('SLOW_REQUEST_THRESHOLD_MS', default=500))
+SLOW_REQUEST_MAX_QUERIES = 100
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
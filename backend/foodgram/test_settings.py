@@ -0,0 +1,30 @@
+"""
+Настройки тестов: SQLite вместо PostgreSQL, быстрый хешер паролей и
+синхронная обработка картинок. Запуск из backend:
+python manage.py test --settings=foodgram.test_settings
+"""
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+SECRET_KEY = 'test'
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+    },
+    # Отдельная база, а не зеркало: тесты маршрутизации проверяют, откуда
+    # пришли данные. Схему тесты создают сами, включается она через
+    # override_settings(READ_REPLICAS=['replica_0'])
+    'replica_0': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_replica.sqlite3',
+    },
+}
+READ_REPLICAS = []
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+MEDIA_ROOT = tempfile.mkdtemp(prefix='foodgram-test-media-')
+IMAGE_PIPELINE_EAGER = True
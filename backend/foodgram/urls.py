@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import metrics
+
 urlpatterns = [
     path('api/', include('api.urls')),
-    path('admin/', admin.site.urls)
+    path('admin/', admin.site.urls),
+    path('metrics/', metrics, name='metrics'),
 ]
@@ -1,7 +1,16 @@
 from django.contrib import admin
 
+from .cookable import sync_recipe
 from .models import (Favourite, Ingredient, IngredientInRecipe, Recipe,
-                     ShoppingList, Tag)
+                     RecipeTrend, ShoppingList, Tag)
+from .search import index_recipe, index_recipes
+
+
+def sync_recipes(recipe_ids):
+    """Обновляет индексы рецептов после правки состава в админке"""
+    for recipe in Recipe.objects.filter(pk__in=recipe_ids):
+        sync_recipe(recipe)
+    index_recipes(list(recipe_ids))
 
 
 # Регистрирую модель рецепта в админку с полями автор и название
@@ -10,14 +19,16 @@ from .models import (Favourite, Ingredient, IngredientInRecipe, Recipe,
 class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'author',
-        'name'
+        'name',
+        'favorites_count'
     )
     # добавляем в админку только для просмотра
-    readonly_fields = ('count_favorites',)
+    readonly_fields = ('favorites_count', 'in_carts_count')
     list_filter = ('author', 'name', 'tags')
 
-    def count_favorites(self, obj):
-        return obj.favorites.count()
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        index_recipe(form.instance)
 
 
 @admin.register(Ingredient)
@@ -54,6 +65,22 @@ class IngredientInRecipeAdmin(admin.ModelAdmin):
         'amount',
     )
 
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change and 'recipe' in form.changed_data:
+            recipe_ids.add(form.initial['recipe'])
+        super().save_model(request, obj, form, change)
+        sync_recipes(recipe_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        sync_recipes([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        sync_recipes(recipe_ids)
+
 
 @admin.register(ShoppingList)
 class ShoppingListAdmin(admin.ModelAdmin):
@@ -61,3 +88,12 @@ class ShoppingListAdmin(admin.ModelAdmin):
         'user',
         'recipe'
     )
+
+
+@admin.register(RecipeTrend)
+class RecipeTrendAdmin(admin.ModelAdmin):
+    list_display = (
+        'recipe',
+        'score',
+        'computed_at'
+    )
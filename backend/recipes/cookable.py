@@ -0,0 +1,72 @@
+from django.db import router, transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField
+from django.db.models.functions import Cast
+
+from .models import IngredientInRecipe, IngredientPosting, Recipe
+
+BATCH_SIZE = 5000
+
+
+def sync_recipe(recipe):
+    """
+    Приводит строки индекса и ingredients_count к текущему составу
+    рецепта. Меняются только строки самого рецепта, поэтому правки
+    рецептов с общими ингредиентами (соль, вода) не ждут друг друга.
+    """
+    current = list(IngredientInRecipe.objects.filter(
+        recipe=recipe).values_list('ingredient_id', flat=True))
+    with transaction.atomic(using=router.db_for_write(IngredientPosting)):
+        IngredientPosting.objects.filter(recipe=recipe).delete()
+        IngredientPosting.objects.bulk_create(
+            [IngredientPosting(ingredient_id=pk, recipe_id=recipe.pk,
+                               ingredients_count=len(current))
+             for pk in current],
+            ignore_conflicts=True
+        )
+    Recipe.objects.filter(pk=recipe.pk).update(ingredients_count=len(current))
+
+
+def rebuild_postings():
+    """Пересобирает весь индекс из IngredientInRecipe"""
+    totals = dict(IngredientInRecipe.objects.order_by().values(
+        'recipe_id').annotate(total=Count('pk')).values_list(
+        'recipe_id', 'total').iterator())
+    rows = IngredientInRecipe.objects.order_by().values_list(
+        'ingredient_id', 'recipe_id')
+    count = 0
+    with transaction.atomic(using=router.db_for_write(IngredientPosting)):
+        IngredientPosting.objects.all().delete()
+        batch = []
+        for ingredient_id, recipe_id in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append(IngredientPosting(
+                ingredient_id=ingredient_id, recipe_id=recipe_id,
+                ingredients_count=totals[recipe_id]))
+            if len(batch) == BATCH_SIZE:
+                IngredientPosting.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        IngredientPosting.objects.bulk_create(batch)
+    return count + len(batch)
+
+
+def rank_by_coverage(ingredient_ids, full=False):
+    """
+    Пары (id рецепта, покрытие) для рецептов, в которых есть хотя бы
+    один из ингредиентов, по убыванию доли ингредиентов рецепта, которые
+    есть у пользователя. Группировка и сортировка идут в SQL по индексу
+    posting_ingredient_idx, пагинатор добавляет LIMIT.
+    """
+    ranked = IngredientPosting.objects.filter(
+        ingredient_id__in=set(ingredient_ids)
+    ).values('recipe_id', 'ingredients_count').annotate(
+        hits=Count('pk')
+    ).annotate(
+        coverage=ExpressionWrapper(
+            Cast('hits', FloatField()) / F('ingredients_count'),
+            output_field=FloatField()
+        )
+    )
+    if full:
+        ranked = ranked.filter(hits=F('ingredients_count'))
+    return ranked.order_by('-coverage', '-hits', '-recipe_id').values_list(
+        'recipe_id', 'coverage')
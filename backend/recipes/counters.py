@@ -0,0 +1,52 @@
+from django.db import connections, router
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def actual_count(related_model, related_field):
+    """Подзапрос с фактическим числом связанных строк"""
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def recount(model, field, related_model, related_field, pks):
+    """
+    Пересчитывает счётчик по фактическим данным. Нужен после bulk_create
+    и других массовых операций, которые не отправляют сигналы.
+    """
+    model.objects.filter(pk__in=pks).update(
+        **{field: actual_count(related_model, related_field)})
+
+
+def delete_rows(model, filter_field, filter_value, field, values):
+    """
+    DELETE строк model, у которых filter_field = filter_value, а field
+    входит в values, одним запросом без выборки строк. QuerySet.delete()
+    при подписанных получателях выбрал бы строки и отправил post_delete
+    на каждую, поэтому счётчики и кеши вызывающий обновляет сам.
+    Каскадов у таких моделей (связей и избранного) нет.
+    """
+    values = list(values)
+    if not values:
+        return 0
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    meta = model._meta
+    sql = (
+        f'DELETE FROM {quote(meta.db_table)} '
+        f'WHERE {quote(meta.get_field(filter_field).column)} = %s '
+        f'AND {quote(meta.get_field(field).column)} '
+        f'IN ({", ".join(["%s"] * len(values))})'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [filter_value, *values])
+        return cursor.rowcount
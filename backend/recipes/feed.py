@@ -0,0 +1,167 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from users.models import Subscribtions, User
+from .models import FeedEntry, Recipe
+
+BATCH_SIZE = 1000
+CELEBRITIES_KEY = 'feed_celebrities'
+
+
+def get_celebrities():
+    """
+    Id авторов с огромным числом подписчиков: их лента собирается при
+    чтении. Таких авторов единицы, множество кешируется и сбрасывается,
+    когда автор переходит порог FEED_FANOUT_MAX_FOLLOWERS.
+    """
+    celebrities = cache.get(CELEBRITIES_KEY)
+    if celebrities is None:
+        celebrities = set(User.objects.filter(
+            subscribers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).values_list('pk', flat=True))
+        cache.set(CELEBRITIES_KEY, celebrities,
+                  settings.FEED_CELEBRITIES_CACHE_TIMEOUT)
+    return celebrities
+
+
+def is_celebrity(author_id):
+    return author_id in get_celebrities()
+
+
+def fan_out(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков автора"""
+    if is_celebrity(recipe.author_id):
+        return
+    followers = Subscribtions.objects.filter(
+        author_id=recipe.author_id).values_list('user_id', flat=True)
+    batch = []
+    for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+        batch.append(FeedEntry(
+            user_id=user_id, recipe_id=recipe.pk,
+            author_id=recipe.author_id, created=recipe.created
+        ))
+        if len(batch) == BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fill_feeds(user_ids, author_id):
+    """Добавляет в ленты пользователей последние рецепты автора"""
+    recipes = list(Recipe.objects.filter(author_id=author_id).order_by(
+        '-created', '-id').values_list(
+        'pk', 'created')[:settings.FEED_BACKFILL_SIZE])
+    if not recipes:
+        return
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, recipe_id=pk,
+                      author_id=author_id, created=created)
+            for user_id in user_ids for pk, created in recipes
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_id, author):
+    """После подписки добавляет в ленту последние рецепты автора"""
+    if is_celebrity(author.pk):
+        return
+    fill_feeds([user_id], author.pk)
+    trim_feed(user_id)
+
+
+def prune(user_id, author_id):
+    """После отписки убирает рецепты автора из ленты"""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def subscribers_changed(author_id, delta):
+    """
+    Вызывается после подписки (delta=1) или отписки (delta=-1). Автор,
+    перешедший порог, перестаёт раскладываться по лентам и убирается из
+    них; вернувшийся под порог раскладывается по лентам всех подписчиков.
+    """
+    count = User.objects.filter(pk=author_id).values_list(
+        'subscribers_count', flat=True).first()
+    limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+    if count is None or count != (limit + 1 if delta > 0 else limit):
+        return
+    cache.delete(CELEBRITIES_KEY)
+    if delta > 0:
+        FeedEntry.objects.filter(author_id=author_id).delete()
+        return
+    followers = Subscribtions.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    batch = []
+    for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+        batch.append(user_id)
+        if len(batch) == BATCH_SIZE:
+            fill_feeds(batch, author_id)
+            batch = []
+    fill_feeds(batch, author_id)
+
+
+def trim_feed(user_id):
+    """Оставляет в ленте пользователя FEED_MAX_ENTRIES новых записей"""
+    entries = FeedEntry.objects.filter(user_id=user_id)
+    limit = settings.FEED_MAX_ENTRIES
+    oldest = entries.order_by('-created', '-recipe_id').values_list(
+        'created', 'recipe_id')[limit:limit + 1]
+    for created, recipe_id in oldest:
+        entries.filter(
+            Q(created__lt=created) | Q(created=created,
+                                       recipe_id__lte=recipe_id)
+        ).delete()
+
+
+def trim_feeds():
+    """
+    Обрезает все ленты длиннее FEED_MAX_ENTRIES: fan-out только
+    добавляет записи, поэтому команда trim_feeds запускается по
+    расписанию. Возвращает число обрезанных лент.
+    """
+    user_ids = list(FeedEntry.objects.order_by().values('user_id').annotate(
+        entries=Count('pk')
+    ).filter(entries__gt=settings.FEED_MAX_ENTRIES).values_list(
+        'user_id', flat=True))
+    for user_id in user_ids:
+        trim_feed(user_id)
+    return len(user_ids)
+
+
+def before(position, created, pk):
+    """Условие «строго после позиции» при порядке по убыванию"""
+    if position is None:
+        return Q()
+    last_created, last_pk = position
+    return Q(**{f'{created}__lt': last_created}) | Q(**{
+        created: last_created, f'{pk}__lt': last_pk})
+
+
+def read_feed(user, position, count):
+    """
+    Позиции (дата, id рецепта) ленты по убыванию. Своя лента читается
+    проходом по индексу (user, -created, -recipe); рецепты авторов без
+    fan-out подмешиваются отдельным запросом, только если такие авторы
+    вообще есть.
+    """
+    items = list(
+        FeedEntry.objects.filter(user=user).filter(
+            before(position, 'created', 'recipe_id')
+        ).order_by('-created', '-recipe_id').values_list(
+            'created', 'recipe_id')[:count]
+    )
+    celebrities = get_celebrities()
+    if celebrities:
+        items.extend(
+            Recipe.objects.filter(
+                author_id__in=celebrities, author__following__user=user
+            ).filter(
+                before(position, 'created', 'pk')
+            ).order_by('-created', '-id').values_list(
+                'created', 'pk')[:count]
+        )
+    return sorted(set(items), reverse=True)[:count]
@@ -0,0 +1,188 @@
+import base64
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from threading import Lock
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.dispatch import Signal
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_TO = 'recipes/'
+VARIANTS_DIR = 'recipes/variants/'
+# Кратно 4, чтобы куски base64 декодировались независимо
+DECODE_CHUNK = 64 * 1024
+SPOOL_SIZE = 1024 * 1024
+EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+VARIANT_FORMATS = (
+    ('WEBP', 'webp'),
+    ('JPEG', 'jpg'),
+)
+
+# Отправляется после записи уменьшенных копий (аргумент recipe_ids)
+variants_ready = Signal()
+
+_pending = set()
+_pending_lock = Lock()
+
+
+class ImageError(ValueError):
+    """Картинка не прошла проверку"""
+
+
+def decode_base64_image(data):
+    """
+    Декодирует data:image/...;base64 частями во временный файл, проверяет
+    картинку по заголовку, уменьшает слишком большую по стороне и
+    возвращает путь к уже сохранённому дубликату или File с именем по
+    sha256 присланного содержимого.
+    """
+    encoded = data.split(';base64,', 1)[-1]
+    if len(encoded) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+        raise ImageError('Слишком большой файл изображения')
+    buffer = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    digest = hashlib.sha256()
+    try:
+        for start in range(0, len(encoded), DECODE_CHUNK):
+            chunk = base64.b64decode(
+                encoded[start:start + DECODE_CHUNK], validate=True)
+            digest.update(chunk)
+            buffer.write(chunk)
+    except ValueError:
+        raise ImageError('Изображение должно быть в base64')
+    buffer.seek(0)
+    extension, oversized = validate_image(buffer)
+    name = f'{UPLOAD_TO}{digest.hexdigest()}.{extension}'
+    if default_storage.exists(name):
+        buffer.close()
+        return name
+    buffer.seek(0)
+    if oversized:
+        buffer = downscale_image(buffer)
+    return File(buffer, name=os.path.basename(name))
+
+
+def validate_image(file):
+    """Расширение файла и признак того, что картинку надо уменьшить"""
+    max_dimension = settings.RECIPE_IMAGE_MAX_DIMENSION
+    try:
+        with Image.open(file) as image:
+            if image.format not in EXTENSIONS:
+                raise ImageError('Неподдерживаемый формат изображения')
+            oversized = max(image.size) > max_dimension
+            image.verify()
+            return EXTENSIONS[image.format], oversized
+    except (UnidentifiedImageError, OSError, SyntaxError,
+            Image.DecompressionBombError):
+        raise ImageError('Файл не является изображением')
+
+
+def downscale_image(file):
+    """
+    Уменьшает картинку до RECIPE_IMAGE_MAX_DIMENSION по большей стороне в
+    том же формате. JPEG декодируется сразу в уменьшенном масштабе.
+    """
+    max_dimension = settings.RECIPE_IMAGE_MAX_DIMENSION
+    result = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        with file, Image.open(file) as image:
+            image_format = image.format
+            image.draft(image.mode, (max_dimension, max_dimension))
+            image.thumbnail((max_dimension, max_dimension))
+            image.save(result, image_format, quality=90)
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        result.close()
+        raise ImageError('Файл не является изображением')
+    result.seek(0)
+    return result
+
+
+def make_variants(name):
+    """Уменьшенные копии в WebP и JPEG для каждого размера из настроек"""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    with default_storage.open(name) as file, Image.open(file) as image:
+        image.load()
+        sizes = {}
+        for label, size in settings.RECIPE_IMAGE_VARIANTS.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size))
+            sizes[label] = {}
+            for image_format, extension in VARIANT_FORMATS:
+                path = f'{VARIANTS_DIR}{stem}_{label}.{extension}'
+                if not default_storage.exists(path):
+                    content = BytesIO()
+                    source = thumbnail
+                    if image_format == 'JPEG' and source.mode != 'RGB':
+                        source = source.convert('RGB')
+                    source.save(content, image_format, quality=85)
+                    default_storage.save(path, ContentFile(content.getvalue()))
+                sizes[label][extension] = path
+    return {'source': name, 'sizes': sizes}
+
+
+def process_recipe_image(name):
+    try:
+        variants = make_variants(name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+        return
+    recipe_ids = list(
+        Recipe.objects.filter(image=name).values_list('pk', flat=True))
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        image_variants=variants, updated_at=timezone.now())
+    variants_ready.send(sender=Recipe, recipe_ids=recipe_ids)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_PIPELINE_WORKERS,
+        thread_name_prefix='recipe-images'
+    )
+
+
+def schedule_recipe_image(name):
+    """
+    Ставит обработку в пул потоков воркера. В режиме IMAGE_PIPELINE_EAGER
+    (тесты, команды) выполняет её сразу.
+    """
+    if settings.IMAGE_PIPELINE_EAGER:
+        process_recipe_image(name)
+        return
+    with _pending_lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    get_executor().submit(run_pending, name)
+
+
+def run_pending(name):
+    """
+    Поток пула живёт дольше запроса, поэтому сам закрывает устаревшие
+    соединения с БД до и после работы.
+    """
+    close_old_connections()
+    try:
+        process_recipe_image(name)
+    finally:
+        close_old_connections()
+        with _pending_lock:
+            _pending.discard(name)
@@ -0,0 +1,46 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+MAX_AMOUNT = 32767
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Старый загрузчик ингредиентов не был идемпотентным, и в базе бывают
+    одинаковые (название, единица). Остаётся ингредиент с меньшим id,
+    рецепты переводятся на него; если в рецепте были оба, количества
+    складываются.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    groups = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('pk'), total=Count('pk')).filter(total__gt=1)
+    for group in groups:
+        keep = group['keep']
+        duplicates = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(pk=keep).values_list('pk', flat=True))
+        for row in IngredientInRecipe.objects.filter(
+                ingredient_id__in=duplicates).order_by('pk'):
+            kept = IngredientInRecipe.objects.filter(
+                recipe_id=row.recipe_id, ingredient_id=keep).first()
+            if kept is None:
+                row.ingredient_id = keep
+                row.save(update_fields=['ingredient'])
+                continue
+            kept.amount = min(kept.amount + row.amount, MAX_AMOUNT)
+            kept.save(update_fields=['amount'])
+            row.delete()
+        Ingredient.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (приложение, модель, поле счётчика, модель связи, поле связи)
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'Favourite', 'recipe'),
+    ('recipes', 'Recipe', 'in_carts_count', 'ShoppingList', 'recipe'),
+    ('users', 'User', 'recipes_count', 'Recipe', 'author'),
+    ('users', 'User', 'subscribers_count', 'Subscribtions', 'author'),
+)
+RELATED_APPS = {
+    'Favourite': 'recipes',
+    'ShoppingList': 'recipes',
+    'Recipe': 'recipes',
+    'Subscribtions': 'users',
+}
+
+
+def backfill_counters(apps, schema_editor):
+    """
+    Счётчики добавлены с нулями, а сигналы уменьшают их на единицу:
+    без заполнения первое удаление нарушило бы CHECK >= 0.
+    """
+    for app_label, model_name, field, related_name, related_field in (
+            COUNTERS):
+        model = apps.get_model(app_label, model_name)
+        related_model = apps.get_model(
+            RELATED_APPS[related_name], related_name)
+        actual = Coalesce(
+            Subquery(
+                related_model.objects.filter(
+                    **{related_field: OuterRef('pk')}
+                ).order_by().values(related_field).annotate(
+                    total=Count('pk')
+                ).values('total'),
+                output_field=IntegerField()
+            ),
+            0
+        )
+        model.objects.update(**{field: actual})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_counters'),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 3.2.19 on 2026-10-18 18:48
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+BATCH_SIZE = 5000
+
+
+def fill_postings(apps, schema_editor):
+    """
+    Индекс и ingredients_count рецептов заполняются по уже сохранённым
+    ингредиентам рецептов
+    """
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    IngredientPosting = apps.get_model('recipes', 'IngredientPosting')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    totals = dict(IngredientInRecipe.objects.order_by().values(
+        'recipe_id').annotate(total=Count('pk')).values_list(
+        'recipe_id', 'total').iterator())
+    batch = []
+    for ingredient_id, recipe_id in IngredientInRecipe.objects.order_by(
+            ).values_list('ingredient_id', 'recipe_id').iterator():
+        batch.append(IngredientPosting(
+            ingredient_id=ingredient_id, recipe_id=recipe_id,
+            ingredients_count=totals[recipe_id]))
+        if len(batch) == BATCH_SIZE:
+            IngredientPosting.objects.bulk_create(batch)
+            batch = []
+    IngredientPosting.objects.bulk_create(batch)
+    Recipe.objects.update(ingredients_count=Coalesce(
+        Subquery(
+            IngredientInRecipe.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Количество ингредиентов'),
+        ),
+        migrations.CreateModel(
+            name='IngredientPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingredients_count', models.PositiveSmallIntegerField(verbose_name='Число ингредиентов рецепта')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Рецепт с ингредиентом',
+                'verbose_name_plural': 'Рецепты с ингредиентами',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ingredientposting',
+            index=models.Index(fields=['ingredient', 'recipe', 'ingredients_count'], name='posting_ingredient_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientposting',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_posting'),
+        ),
+        migrations.RunPython(fill_postings, migrations.RunPython.noop),
+    ]
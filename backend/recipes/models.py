@@ -1,7 +1,9 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              Subquery, UniqueConstraint, Value)
 
 User = get_user_model()
 
@@ -19,11 +21,53 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            UniqueConstraint(fields=['name', 'measurement_unit'],
+                             name='unique_ingredient_unit')
+        ]
 
     def __str__(self):
         return f'{self.name} измеряется в {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Запросы рецептов с подгрузкой связанных данных для API"""
+
+    def with_related(self, user):
+        return self.prefetch_related(
+            Prefetch('author', queryset=User.objects.with_is_subscribed(user)),
+            'tags',
+            Prefetch(
+                'ingredients_in_recipe',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient')
+            ),
+        )
+
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_favorited=Exists(Favourite.objects.filter(
+                recipe=OuterRef('pk'), user=user)),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                recipe=OuterRef('pk'), user=user))
+        )
+
+    def limited_per_author(self, limit):
+        """Оставляет не больше limit последних рецептов каждого автора"""
+        if limit is None:
+            return self
+        return self.filter(pk__in=Subquery(
+            Recipe.objects.filter(
+                author=OuterRef('author')
+            ).order_by('-pk').values('pk')[:limit]
+        ))
+
+
 class Recipe(models.Model):
     """Модель рецепта"""
     author = models.ForeignKey(
@@ -43,6 +87,12 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Изображение',
         upload_to='recipes/')
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         verbose_name='Ингридиенты в рецепте',
@@ -60,10 +110,47 @@ class Recipe(models.Model):
             1, message='Минимальное время приготовления 1 минута')
         ]
     )
+    ingredients_count = models.PositiveSmallIntegerField(
+        verbose_name='Количество ингредиентов',
+        default=0,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата публикации',
+        auto_now_add=True
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        ordering = ('-created', '-id')
+        indexes = [
+            models.Index(fields=['created', 'id'],
+                         name='recipe_created_id_idx'),
+            models.Index(fields=['favorites_count', 'id'],
+                         name='recipe_favorites_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -149,6 +236,11 @@ class Favourite(models.Model):
         related_name='favorites',
         on_delete=models.CASCADE
     )
+    created = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Избраный'
@@ -178,6 +270,11 @@ class ShoppingList(models.Model):
         related_name='shopping',
         on_delete=models.CASCADE
     )
+    created = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -190,3 +287,144 @@ class ShoppingList(models.Model):
         return (
             f'{self.user} добавил в корзину {self.recipe}'
         )
+
+
+class RecipeTrend(models.Model):
+    """Предрасчитанный рейтинг популярности рецепта за последние дни"""
+    recipe = models.OneToOneField(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='trend',
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    score = models.FloatField(
+        verbose_name='Рейтинг',
+        db_index=True
+    )
+    computed_at = models.DateTimeField(
+        verbose_name='Дата расчёта'
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+
+    def __str__(self):
+        return f'{self.recipe} - {self.score:.2f}'
+
+
+class RecipeSearchTerm(models.Model):
+    """
+    Запасной обратный индекс для поиска рецептов на базах без tsvector:
+    терм - рецепт - вес поля, в котором он встретился.
+    """
+    term = models.CharField(
+        verbose_name='Терм',
+        max_length=64
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='search_terms',
+        on_delete=models.CASCADE
+    )
+    weight = models.PositiveSmallIntegerField(
+        verbose_name='Вес'
+    )
+
+    class Meta:
+        verbose_name = 'Поисковый терм'
+        verbose_name_plural = 'Поисковые термы'
+        indexes = [
+            models.Index(fields=['term', 'recipe'],
+                         name='search_term_recipe_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.term} в {self.recipe}'
+
+
+class IngredientPosting(models.Model):
+    """
+    Обратный индекс «ингредиент - рецепты» для поиска по имеющимся
+    продуктам: строка на пару ингредиент-рецепт с числом ингредиентов
+    рецепта. Правка рецепта трогает только его строки, а покрытие
+    считается в SQL по индексу без обращения к таблице рецептов.
+    """
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        related_name='postings',
+        on_delete=models.CASCADE
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='postings',
+        on_delete=models.CASCADE
+    )
+    ingredients_count = models.PositiveSmallIntegerField(
+        verbose_name='Число ингредиентов рецепта'
+    )
+
+    class Meta:
+        verbose_name = 'Рецепт с ингредиентом'
+        verbose_name_plural = 'Рецепты с ингредиентами'
+        constraints = [
+            UniqueConstraint(fields=['recipe', 'ingredient'],
+                             name='unique_posting')
+        ]
+        indexes = [
+            models.Index(fields=['ingredient', 'recipe', 'ingredients_count'],
+                         name='posting_ingredient_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient_id} в {self.recipe_id}'
+
+
+class FeedEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя. Заполняется при публикации
+    рецепта (fan-out) и при подписке; дата копируется из рецепта, чтобы
+    страница ленты читалась одним проходом по индексу.
+    """
+    user = models.ForeignKey(
+        User,
+        verbose_name='Читатель',
+        related_name='feed_entries',
+        on_delete=models.CASCADE
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='feed_entries',
+        on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор',
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата публикации рецепта'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            UniqueConstraint(fields=['user', 'recipe'],
+                             name='unique_feed_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created', '-recipe'],
+                         name='feed_user_created_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
@@ -0,0 +1,145 @@
+import re
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections, router, transaction
+from django.db.models import (Count, F, FloatField, OuterRef, Subquery, Sum,
+                              Value)
+
+from .models import IngredientInRecipe, Recipe, RecipeSearchTerm
+
+SEARCH_CONFIG = 'russian'
+INDEX_NAME = 'recipe_search_vector_idx'
+MAX_TERM_LENGTH = 64
+WEIGHTS = (
+    ('name', 'A', 3),
+    ('text', 'B', 1),
+    ('ingredients', 'C', 2),
+)
+WORD = re.compile(r'\w+')
+# Грубый стеммер для запасного индекса: отрезает частые окончания
+ENDINGS = sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя',
+    'ое', 'ее', 'ый', 'ий', 'ой', 'ые', 'ие', 'ых', 'их', 'ом', 'ем',
+    'ах', 'ях', 'ам', 'ям', 'ов', 'ев', 'а', 'я', 'ы', 'и', 'у', 'ю',
+    'е', 'о', 'ь', 's',
+), key=len, reverse=True)
+MIN_STEM = 3
+REINDEX_BATCH = 500
+
+
+def is_postgresql(using):
+    return connections[using].vendor == 'postgresql'
+
+
+def ensure_search_index(connection):
+    """
+    GIN-индекс по search_vector. Создаётся из миграции core и из команды
+    rebuild_search_index, если колонка уже есть (только PostgreSQL).
+    """
+    if connection.vendor != 'postgresql':
+        return
+    table = Recipe._meta.db_table
+    with connection.cursor() as cursor:
+        columns = [
+            column.name for column in
+            connection.introspection.get_table_description(cursor, table)
+        ]
+        if 'search_vector' in columns:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+                f'ON {table} USING gin (search_vector)'
+            )
+
+
+def stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def get_terms(text):
+    return {
+        stem(word)[:MAX_TERM_LENGTH] for word in WORD.findall(text.lower())
+    }
+
+
+def get_documents(recipe_ids):
+    """Название, описание и названия ингредиентов рецептов"""
+    documents = {
+        pk: {'name': name, 'text': text, 'ingredients': []}
+        for pk, name, text in Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('pk', 'name', 'text')
+    }
+    for recipe_id, name in IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids).values_list(
+            'recipe_id', 'ingredient__name'):
+        documents[recipe_id]['ingredients'].append(name)
+    for document in documents.values():
+        document['ingredients'] = ' '.join(document['ingredients'])
+    return documents
+
+
+def index_recipes(recipe_ids):
+    """
+    Обновляет поисковый индекс рецептов: tsvector на PostgreSQL или
+    таблицу термов RecipeSearchTerm на остальных базах.
+    """
+    documents = get_documents(recipe_ids)
+    using = router.db_for_write(Recipe)
+    with transaction.atomic(using=using):
+        if is_postgresql(using):
+            for pk, document in documents.items():
+                vector = None
+                for field, weight, _ in WEIGHTS:
+                    part = SearchVector(
+                        Value(document[field]),
+                        config=SEARCH_CONFIG, weight=weight
+                    )
+                    vector = part if vector is None else vector + part
+                Recipe.objects.filter(pk=pk).update(search_vector=vector)
+            return
+        RecipeSearchTerm.objects.filter(recipe_id__in=documents).delete()
+        terms = []
+        for pk, document in documents.items():
+            for field, _, weight in WEIGHTS:
+                terms.extend(
+                    RecipeSearchTerm(recipe_id=pk, term=term, weight=weight)
+                    for term in get_terms(document[field])
+                )
+        RecipeSearchTerm.objects.bulk_create(terms)
+
+
+def index_recipe(recipe):
+    index_recipes([recipe.pk])
+
+
+def index_ingredient_recipes(ingredient_id):
+    """Переиндексирует рецепты с ингредиентом после его переименования"""
+    recipe_ids = list(IngredientInRecipe.objects.filter(
+        ingredient_id=ingredient_id).values_list('recipe_id', flat=True))
+    for start in range(0, len(recipe_ids), REINDEX_BATCH):
+        index_recipes(recipe_ids[start:start + REINDEX_BATCH])
+
+
+def search_recipes(queryset, value):
+    """Рецепты, подходящие под все слова запроса, с рангом rank"""
+    if is_postgresql(queryset.db):
+        query = SearchQuery(value, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-id')
+    terms = get_terms(value)
+    if not terms:
+        return queryset.none()
+    matches = RecipeSearchTerm.objects.filter(
+        recipe=OuterRef('pk'), term__in=terms
+    ).order_by().values('recipe').annotate(
+        matched=Count('term', distinct=True),
+        total=Sum('weight')
+    )
+    return queryset.annotate(
+        matched=Subquery(matches.values('matched')),
+        rank=Subquery(matches.values('total'), output_field=FloatField())
+    ).filter(matched=len(terms)).order_by('-rank', '-id')
@@ -0,0 +1,97 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from users.models import Subscribtions
+from .feed import backfill, fan_out, prune, subscribers_changed
+from .images import schedule_recipe_image
+from .models import Favourite, Ingredient, Recipe, ShoppingList, User
+from .search import index_ingredient_recipes
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    name = instance.image.name
+    if name and instance.image_variants.get('source') != name:
+        transaction.on_commit(lambda: schedule_recipe_image(name))
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно меняет счётчик через F-выражение, без чтения строки"""
+    if pk is not None:
+        model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Favourite)
+def favourite_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favourite)
+def favourite_deleted(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingList)
+def shopping_list_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'in_carts_count', 1)
+
+
+@receiver(post_delete, sender=ShoppingList)
+def shopping_list_deleted(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'in_carts_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: fan_out(instance))
+
+
+@receiver(post_save, sender=Subscribtions)
+def subscription_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    def update_feeds():
+        backfill(instance.user_id, instance.author)
+        subscribers_changed(instance.author_id, 1)
+
+    transaction.on_commit(update_feeds)
+
+
+@receiver(post_delete, sender=Subscribtions)
+def subscription_deleted(sender, instance, **kwargs):
+    prune(instance.user_id, instance.author_id)
+    transaction.on_commit(
+        lambda: subscribers_changed(instance.author_id, -1))
+
+
+@receiver(pre_save, sender=Ingredient)
+def ingredient_saving(sender, instance, **kwargs):
+    """Запоминает прежнее название, чтобы post_save заметил переименование"""
+    instance._old_name = None
+    if not instance._state.adding:
+        instance._old_name = Ingredient.objects.filter(
+            pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    old_name = getattr(instance, '_old_name', None)
+    if not created and old_name is not None and old_name != instance.name:
+        transaction.on_commit(lambda: index_ingredient_recipes(instance.pk))
@@ -0,0 +1,48 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Favourite, RecipeTrend, ShoppingList
+
+BATCH_SIZE = 1000
+
+
+def compute_scores(now):
+    """
+    Рейтинг рецепта — сумма добавлений в избранное и корзину за окно
+    TRENDING_WINDOW_DAYS, где вес каждого добавления убывает вдвое
+    за TRENDING_HALF_LIFE_HOURS. БД отдаёт только количества по часам.
+    """
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    half_life = settings.TRENDING_HALF_LIFE_HOURS
+    scores = defaultdict(float)
+    for model, weight in ((Favourite, settings.TRENDING_FAVORITE_WEIGHT),
+                          (ShoppingList, settings.TRENDING_CART_WEIGHT)):
+        buckets = model.objects.filter(created__gte=since).annotate(
+            hour=TruncHour('created')
+        ).values_list('recipe_id', 'hour').annotate(
+            total=Count('pk')
+        ).order_by()
+        for recipe_id, hour, total in buckets.iterator():
+            age = (now - hour).total_seconds() / 3600
+            scores[recipe_id] += weight * total * 0.5 ** (age / half_life)
+    return scores
+
+
+def rebuild_trending():
+    """Пересобирает таблицу рейтинга одной транзакцией"""
+    now = timezone.now()
+    scores = compute_scores(now)
+    with transaction.atomic():
+        RecipeTrend.objects.all().delete()
+        RecipeTrend.objects.bulk_create(
+            [RecipeTrend(recipe_id=recipe_id, score=score, computed_at=now)
+             for recipe_id, score in scores.items()],
+            batch_size=BATCH_SIZE
+        )
+    return len(scores)
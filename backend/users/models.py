@@ -1,6 +1,23 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (BooleanField, Exists, OuterRef,
+                              UniqueConstraint, Value)
+
+
+class UserQuerySet(models.QuerySet):
+    """Запросы пользователей с отметкой подписки текущего пользователя"""
+
+    def with_is_subscribed(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField()))
+        return self.annotate(is_subscribed=Exists(
+            Subscribtions.objects.filter(user=user, author=OuterRef('pk'))
+        ))
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей с кастомными запросами"""
 
 
 class User(AbstractUser):
@@ -11,6 +28,16 @@ class User(AbstractUser):
         max_length=254,
         unique=True
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
         'username',
@@ -18,6 +45,8 @@ class User(AbstractUser):
         'last_name'
     ]
 
+    objects = CustomUserManager()
+
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
@@ -0,0 +1,18 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Subscribtions, User
+
+
+@receiver(post_save, sender=Subscribtions)
+def subscription_created(sender, instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            subscribers_count=F('subscribers_count') + 1)
+
+
+@receiver(post_delete, sender=Subscribtions)
+def subscription_deleted(sender, instance, **kwargs):
+    User.objects.filter(pk=instance.author_id).update(
+        subscribers_count=F('subscribers_count') - 1)